@@ -1,12 +1,31 @@
-from fastapi import FastAPI, Query, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+import json
+import os
+import numpy as np
 import pandas as pd
-from models import BacktestResult, PriceData
+from typing import List, Optional
+from models import (
+    BacktestJobRequest, BacktestJobStatus, BacktestResult, PortfolioResult, PriceData, SweepRequest, SweepResult
+)
 from datetime import datetime, timedelta
 from backtest import ExchangeSimulator, BacktestManager
-from bs import compute_rsi
+from bs import add_indicators
 from bots import ModernRSIVolumeBot as SimpleBot
-import requests
+from sweep import run_sweep
+from portfolio import PortfolioBacktest
+from bybit import market_client
+from cache import ResponseCache
+from jobs import JobManager
+from ingest import KlineIngestor
+from prewarm import PrewarmScheduler
+from columnar import ARROW_MEDIA_TYPE, accepts_arrow, epoch_ms, to_arrow
+from downsample import minmax_indices, window_indices
+from metrics import PROMETHEUS_MEDIA_TYPE, ServerTimingMiddleware, render, timed
+import time
 from models import PriceData
 
 
@@ -28,7 +47,56 @@ def get_unix_time_range(period: str):
 
 
 
-app = FastAPI()
+TICKERS = [
+    "BTCUSDT",  # Bitcoin
+    "ETHUSDT",  # Ethereum
+    "SOLUSDT",  # Solana
+    "DOGEUSDT", # Dogecoin
+    "BNBUSDT",  # Binance Coin
+    "XRPUSDT",  # Ripple
+    "ADAUSDT",  # Cardano
+    "DOTUSDT",  # Polkadot
+    "LTCUSDT",  # Litecoin
+    "LINKUSDT"  # Chainlink
+]
+
+# Пары и интервалы, которые /history отдаёт из потока kline. Пустой INGEST_TICKERS отключает поток
+INGEST_TICKERS = [t for t in os.environ.get("INGEST_TICKERS", ",".join(TICKERS)).split(",") if t]
+INGEST_INTERVALS = [i for i in os.environ.get("INGEST_INTERVALS", "D,60").split(",") if i]
+INGEST_CAPACITY = int(os.environ.get("INGEST_CAPACITY", "1000"))
+
+# Пары и интервалы, которые держатся в памяти вместе с индикаторами. Пустой PREWARM_TICKERS отключает прогрев
+PREWARM_TICKERS = [t for t in os.environ.get("PREWARM_TICKERS", ",".join(TICKERS)).split(",") if t]
+PREWARM_INTERVALS = [i for i in os.environ.get("PREWARM_INTERVALS", "1,5,15,60,D").split(",") if i]
+PREWARM_CAPACITY = int(os.environ.get("PREWARM_CAPACITY", "1000"))
+# Как часто обновлять текущую (незакрытую) свечу, в секундах; 0 - только по закрытию
+PREWARM_REFRESH = float(os.environ.get("PREWARM_REFRESH", "60"))
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Общий на процесс клиент Bybit: один пул соединений и один бюджет запросов
+    app.state.bybit = market_client()
+    app.state.history_cache = ResponseCache()
+    app.state.jobs = JobManager(max_workers=2)
+    app.state.ingestor = KlineIngestor(app.state.bybit, INGEST_TICKERS, INGEST_INTERVALS, capacity=INGEST_CAPACITY)
+    # Пары живого потока /history берёт из его буфера, прогревать их не нужно
+    app.state.prewarm = PrewarmScheduler(
+        app.state.bybit, PREWARM_TICKERS, PREWARM_INTERVALS, capacity=PREWARM_CAPACITY, refresh=PREWARM_REFRESH,
+        skip=app.state.ingestor.rings
+    )
+    await app.state.ingestor.start()
+    await app.state.prewarm.start()
+    yield
+    await app.state.prewarm.stop()
+    await app.state.ingestor.stop()
+    await app.state.jobs.close()
+    await run_in_threadpool(app.state.bybit.close)
+
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,37 +104,248 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 
 
 
 
 @app.get("/backtest", response_model=BacktestResult)
-def run_backtest(
+async def run_backtest(
+    request: Request,
     ticker: str = Query(...),
     start_date: str = Query(...),
     end_date: str = Query(...),
-    timeframe: str = Query("1h")
+    timeframe: str = Query("1h"),
+    vectorized: bool = Query(False),
+    max_points: Optional[int] = Query(None, ge=3),
+    window_start: Optional[str] = Query(None),
+    window_end: Optional[str] = Query(None),
+    profile: bool = Query(False),
+    intrabar: bool = Query(False)
 ):
     try:
         start = datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.strptime(end_date, "%Y-%m-%d")
-        exchange = ExchangeSimulator(symbol=ticker, timeframe=timeframe)
-        exchange.load_data(start_date=start, end_date=end)
+        exchange = ExchangeSimulator(symbol=ticker, timeframe=timeframe, intrabar=intrabar)
+        await exchange.load_data_async(request.app.state.bybit, start_date=start, end_date=end)
 
         bot = SimpleBot(exchange)
         manager = BacktestManager(exchange, bot)
-        manager.run()
+        # В режиме профилирования к ответу добавляется сводка RunProfile.summary()
+        run_profile = None
+        if profile:
+            run_profile = (await run_in_threadpool(manager.profile, vectorized=vectorized)).summary()
+        else:
+            await run_in_threadpool(manager.run, vectorized=vectorized)
+
+        window = (to_epoch_ms(window_start), to_epoch_ms(window_end))
+        with timed("serialize"):
+            if accepts_arrow(request):
+                content = build_backtest_arrow(exchange, manager, max_points, window, run_profile)
+                return Response(content=content, media_type=ARROW_MEDIA_TYPE)
+            return build_backtest_result(exchange, manager, max_points, window, run_profile)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+
+def to_epoch_ms(value):
+    return None if value is None else int(pd.Timestamp(value).timestamp() * 1000)
+
+
+def select_points(manager, max_points=None, window=(None, None)):
+    # Окно просмотра по времени, затем прореживание min/max до max_points точек
+    lo, hi = window_indices(manager.timestamps, *window)
+    return lo + minmax_indices(manager.equity_curve[lo:hi], max_points)
+
+
+def window_trades(exchange, window=(None, None)):
+    trades = exchange.trades[:exchange.trade_count]
+    lo, hi = window_indices(trades["timestamp"], *window)
+    return trades[lo:hi]
+
+
+def format_trades(trades):
+    return [
+        {"time": t, "type": "BUY" if side > 0 else "SELL", "price": price}
+        for t, side, price in zip(
+            pd.to_datetime(trades["timestamp"], unit="ms").strftime("%Y-%m-%d %H:%M"),
+            trades["side"].tolist(),
+            trades["price"].tolist()
+        )
+    ]
+
+
+def build_backtest_result(exchange, manager, max_points=None, window=(None, None), profile=None):
+    points = select_points(manager, max_points, window)
+    return BacktestResult(
+        timestamps=pd.to_datetime(manager.timestamps[points], unit="ms").strftime("%Y-%m-%d %H:%M").tolist(),
+        equity_curve=manager.equity_curve[points].tolist(),
+        trade_history=format_trades(window_trades(exchange, window)),
+        final_balance=exchange.get_equity(),
+        profile=profile
+    )
+
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def stream_event(event, fmt):
+    payload = json.dumps(event)
+    return f"data: {payload}\n\n" if fmt == "sse" else payload + "\n"
+
+
+def stream_chunk(timestamps, equity_curve, trades, max_points=None):
+    points = minmax_indices(equity_curve, max_points)
+    timestamps, equity_curve = timestamps[points], equity_curve[points]
+    events = [{
+        "type": "equity",
+        "timestamps": pd.to_datetime(timestamps, unit="ms").strftime("%Y-%m-%d %H:%M").tolist(),
+        "equity_curve": equity_curve.tolist()
+    }]
+    if len(trades):
+        events.append({
+            "type": "trades",
+            "trade_history": format_trades(trades)
+        })
+    return events
+
+
+@app.get("/backtest/stream")
+async def stream_backtest(
+    request: Request,
+    ticker: str = Query(...),
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    timeframe: str = Query("1h"),
+    vectorized: bool = Query(False),
+    chunk_size: int = Query(5000, ge=1),
+    format: str = Query("ndjson"),
+    max_points: Optional[int] = Query(None, ge=3)
+):
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format: {format}")
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        exchange = ExchangeSimulator(symbol=ticker, timeframe=timeframe)
+        await exchange.load_data_async(request.app.state.bybit, start_date=start, end_date=end)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    manager = BacktestManager(exchange, SimpleBot(exchange))
+    chunks = manager.iter_run(chunk_size=chunk_size, vectorized=vectorized)
+    total = max(len(exchange.timestamp) - 1, 1)
+
+    def next_events():
+        # Кусок сериализуется в том же потоке, пока буферы менеджера не перезаписаны
+        chunk = next(chunks, None)
+        if chunk is None:
+            return None
+        # Бюджет точек делится между кусками пропорционально их длине
+        budget = None if max_points is None else max(3, max_points * len(chunk[0]) // total)
+        return stream_chunk(*chunk, max_points=budget)
+
+    async def events():
+        try:
+            while (chunk_events := await run_in_threadpool(next_events)) is not None:
+                for event in chunk_events:
+                    yield stream_event(event, format)
+            yield stream_event({"type": "done", "final_balance": float(exchange.get_equity())}, format)
+        except Exception as e:
+            yield stream_event({"type": "error", "detail": str(e)}, format)
+
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[format])
+
+
+
+def build_backtest_arrow(exchange, manager, max_points=None, window=(None, None), profile=None):
+    points = select_points(manager, max_points, window)
+    trades = window_trades(exchange, window)
+    return to_arrow(
+        {"timestamps": manager.timestamps[points], "equity_curve": manager.equity_curve[points]},
+        {
+            "trade_history": {
+                "time": trades["timestamp"].tolist(),
+                "type": np.where(trades["side"] > 0, "BUY", "SELL").tolist(),
+                "price": trades["price"].tolist()
+            },
+            "final_balance": float(exchange.get_equity()),
+            "profile": profile
+        }
+    )
+
+
+
+@app.post("/backtest/jobs", response_model=BacktestJobStatus)
+async def submit_backtest_job(job_request: BacktestJobRequest, request: Request):
+    try:
+        start = datetime.strptime(job_request.start_date, "%Y-%m-%d")
+        end = datetime.strptime(job_request.end_date, "%Y-%m-%d")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    jobs = request.app.state.jobs
+
+    async def work(job):
+        exchange = ExchangeSimulator(symbol=job_request.ticker, timeframe=job_request.timeframe)
+        job.exchange = exchange
+        await exchange.load_data_async(request.app.state.bybit, start_date=start, end_date=end)
+
+        manager = BacktestManager(exchange, SimpleBot(exchange))
+        await jobs.run_in_worker(manager.run, vectorized=job_request.vectorized)
+        return build_backtest_result(exchange, manager)
+
+    key = (job_request.ticker, job_request.start_date, job_request.end_date, job_request.timeframe, job_request.vectorized)
+    return job_status(jobs.submit(key, work))
 
-        return BacktestResult(
-            timestamps=[ts.strftime("%Y-%m-%d %H:%M") for ts in manager.timestamps],
-            equity_curve=manager.equity_curve,
+
+
+@app.get("/backtest/jobs/{job_id}", response_model=BacktestJobStatus)
+def get_backtest_job(job_id: str, request: Request):
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+
+
+def job_status(job):
+    return BacktestJobStatus(job_id=job.id, status=job.status, result=job.result, error=job.error, **job.progress())
+
+
+
+@app.get("/portfolio_backtest", response_model=PortfolioResult)
+async def run_portfolio_backtest(
+    request: Request,
+    tickers: List[str] = Query(...),
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    timeframe: str = Query("1h"),
+    bot: str = Query("ModernRSIVolumeBot"),
+    vectorized: bool = Query(True)
+):
+    try:
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        portfolio = PortfolioBacktest(tickers, timeframe=timeframe, bot=bot)
+        await portfolio.load_data_async(request.app.state.bybit, start_date=start, end_date=end)
+        await run_in_threadpool(portfolio.run, vectorized=vectorized)
+
+        return PortfolioResult(
+            timestamps=portfolio.timestamps.dt.strftime("%Y-%m-%d %H:%M").tolist(),
+            equity_curve=portfolio.equity_curve.tolist(),
+            symbol_equity={symbol: curve.tolist() for symbol, curve in portfolio.symbol_equity.items()},
             trade_history=[
-                {"time": t.strftime("%Y-%m-%d %H:%M"), "type": act, "price": price}
-                for t, act, price in exchange.history
+                {"time": t.strftime("%Y-%m-%d %H:%M"), "symbol": symbol, "type": act, "price": price, "amount": amount}
+                for t, symbol, act, price, amount in portfolio.history
             ],
-            final_balance=exchange.get_equity()
+            final_balance=portfolio.get_equity()
         )
 
     except Exception as e:
@@ -74,92 +353,174 @@ def run_backtest(
 
 
 
+@app.post("/sweep", response_model=SweepResult)
+async def run_parameter_sweep(request: SweepRequest, http_request: Request):
+    try:
+        start = datetime.strptime(request.start_date, "%Y-%m-%d")
+        end = datetime.strptime(request.end_date, "%Y-%m-%d")
+        exchange = ExchangeSimulator(symbol=request.ticker, timeframe=request.timeframe)
+        await exchange.load_data_async(http_request.app.state.bybit, start_date=start, end_date=end)
+
+        results = await run_in_threadpool(
+            run_sweep, exchange.data, request.bot, request.grid,
+            symbol=request.ticker, timeframe=request.timeframe, processes=request.processes
+        )
+        return SweepResult(combinations=len(results), results=results)
+
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+
 @app.get("/tickers")
 def get_available_tickers():
-    return [
-        "BTCUSDT",  # Bitcoin
-        "ETHUSDT",  # Ethereum
-        "SOLUSDT",  # Solana
-        "DOGEUSDT", # Dogecoin
-        "BNBUSDT",  # Binance Coin
-        "XRPUSDT",  # Ripple
-        "ADAUSDT",  # Cardano
-        "DOTUSDT",  # Polkadot
-        "LTCUSDT",  # Litecoin
-        "LINKUSDT"  # Chainlink
-    ]
+    return TICKERS
+
+
+
+# Длительность свечи Bybit в секундах по коду интервала
+INTERVAL_SECONDS = {"D": 86400, "W": 7 * 86400, "M": 30 * 86400}
+
+HISTORY_MAX_TTL = 60
+
+
+def history_ttl(interval: str, now: float = None):
+    # Кэш живёт долю длительности свечи, но не дольше минуты и не дольше закрытия текущей свечи
+    step = int(interval) * 60 if interval.isdigit() else INTERVAL_SECONDS.get(interval, 60)
+    now = time.time() if now is None else now
+    until_close = step - now % step
+    return max(1.0, min(step / 60, HISTORY_MAX_TTL, until_close))
+
+
+def empty_price_data(recommendation, arrow=False):
+    if arrow:
+        return to_arrow({"dates": np.empty(0, dtype=np.int64), "prices": np.empty(0)}, {"recommendation": recommendation})
+    return {"dates": [], "prices": [], "sma": [], "ema": [], "rsi": [], "recommendation": recommendation}
+
+
+def price_data_from_klines(raw, interval, show_sma, show_ema, show_rsi, arrow=False, max_points=None):
+    # Bybit отдаёт свечи от новых к старым; индикаторы и ответ - от старых к новым
+    df = pd.DataFrame(raw[::-1], columns=["timestamp", "open", "high", "low", "close", "volume", "_"])
+    df["Date"] = pd.to_datetime(df["timestamp"].astype(float), unit='ms')
+    df["Close"] = df["close"].astype(float)
+    add_indicators(df, show_sma, show_ema, show_rsi)
+    return price_data_from_frame(df, interval, show_sma, show_ema, show_rsi, arrow, max_points)
+
+
+def price_data_from_frame(df, interval, show_sma, show_ema, show_rsi, arrow=False, max_points=None):
+    # df - колонки Date, Close и рассчитанные индикаторы SMA/EMA/RSI
+    indicators = []
+    if show_sma:
+        indicators.append('SMA')
+    if show_ema:
+        indicators.append('EMA')
+    if show_rsi:
+        indicators.append('RSI')
+
+    df = df.dropna(subset=indicators)
+
+    if df.empty:
+        return empty_price_data("not enough data for indicators", arrow)
+
+    last_price = df["Close"].iloc[-1]
+    last_sma = df["SMA"].iloc[-1] if show_sma else last_price
+
+    if last_price > last_sma:
+        rec = "buy"
+    elif last_price < last_sma:
+        rec = "sell"
+    else:
+        rec = "hold"
+
+    df = df.iloc[minmax_indices(df["Close"], max_points)]
+
+    if arrow:
+        columns = {"dates": epoch_ms(df["Date"]), "prices": df["Close"].to_numpy()}
+        for name in indicators:
+            columns[name.lower()] = df[name].to_numpy(dtype=float)
+        return to_arrow(columns, {"recommendation": rec})
+
+    date_fmt = "%Y-%m-%d %H:%M" if interval.isdigit() else "%Y-%m-%d"
+    return PriceData(
+        dates=df["Date"].dt.strftime(date_fmt).tolist(),
+        prices=df["Close"].tolist(),
+        sma=df["SMA"].tolist() if show_sma else [],
+        ema=df["EMA"].tolist() if show_ema else [],
+        rsi=df["RSI"].tolist() if show_rsi else [],
+        recommendation=rec
+    )
 
 
 
 @app.get("/history", response_model=PriceData)
-def get_price_data(
+async def get_price_data(
+    request: Request,
     ticker: str = Query(...),  # Например: BTCUSDT
     interval: str = Query("60"),  # Bybit: "1", "3", "5", ..., "D", "W"
     limit: int = Query(100),
     show_sma: bool = Query(True),
     show_ema: bool = Query(False),
-    show_rsi: bool = Query(False)
+    show_rsi: bool = Query(False),
+    max_points: Optional[int] = Query(None, ge=3)
 ):
+    arrow = accepts_arrow(request)
+    prewarm = request.app.state.prewarm
+    # Пары из живого потока kline отдаются из его буфера, прогретые - из памяти с готовыми индикаторами
+    ring = request.app.state.ingestor.ring(ticker, interval, limit)
+    warm = prewarm.get(ticker, interval, limit) if ring is None else None
+
+    async def load():
+        if warm is not None:
+            with timed("serialize"):
+                return price_data_from_frame(warm[1].iloc[-limit:], interval, show_sma, show_ema, show_rsi, arrow, max_points)
+        if ring is not None:
+            raw = ring.latest(limit)
+        else:
+            result = await request.app.state.bybit.get_kline(ticker, interval, category="spot", limit=limit)
+            if result["retCode"] != 0 or not result["result"]["list"]:
+                return empty_price_data("no data", arrow)
+            raw = result["result"]["list"]
+
+        with timed("serialize"):
+            return price_data_from_klines(raw, interval, show_sma, show_ema, show_rsi, arrow, max_points)
+
     try:
-        url = "https://api.bybit.com/v5/market/kline"
-        params = {
-            "category": "spot",
-            "symbol": ticker,
-            "interval": interval,
-            "limit": limit
-        }
-        response = requests.get(url, params=params)
-        result = response.json()
-
-        if result["retCode"] != 0 or not result["result"]["list"]:
-            return {"dates": [], "prices": [], "sma": [], "ema": [], "rsi": [], "recommendation": "no data"}
-
-        raw = result["result"]["list"]
-        df = pd.DataFrame(raw, columns=["timestamp", "open", "high", "low", "close", "volume", "_"])
-        df["Date"] = pd.to_datetime(df["timestamp"].astype(float), unit='ms')
-        df["Close"] = df["close"].astype(float)
-
-        # Индикаторы
-        df["SMA"] = df["Close"].rolling(window=5).mean() if show_sma else None
-        df["EMA"] = df["Close"].ewm(span=5, adjust=False).mean() if show_ema else None
-        df["RSI"] = compute_rsi(df["Close"]) if show_rsi else None
-
-        indicators = []
-        if show_sma:
-            indicators.append('SMA')
-        if show_ema:
-            indicators.append('EMA')
-        if show_rsi:
-            indicators.append('RSI')
-
-        df = df.dropna(subset=indicators)
-
-        if df.empty:
-            return {"dates": [], "prices": [], "sma": [], "ema": [], "rsi": [], "recommendation": "not enough data for indicators"}
-
-        last_price = df["Close"].iloc[-1]
-        last_sma = df["SMA"].iloc[-1] if show_sma else last_price
-
-        if last_price > last_sma:
-            rec = "buy"
-        elif last_price < last_sma:
-            rec = "sell"
+        # Версия буфера в ключе: ответ из памяти пересчитывается при каждом обновлении свечей
+        if warm is not None:
+            version = ("prewarm", warm[0])
         else:
-            rec = "hold"
-
-        date_fmt = "%Y-%m-%d %H:%M" if interval.isdigit() else "%Y-%m-%d"
-        return PriceData(
-            dates=df["Date"].dt.strftime(date_fmt).tolist(),
-            prices=df["Close"].tolist(),
-            sma=df["SMA"].tolist() if show_sma else [],
-            ema=df["EMA"].tolist() if show_ema else [],
-            rsi=df["RSI"].tolist() if show_rsi else [],
-            recommendation=rec
-        )
+            version = ring.version if ring is not None else None
+        key = (ticker, interval, limit, show_sma, show_ema, show_rsi, arrow, max_points, version)
+        data = await request.app.state.history_cache.get_or_load(key, history_ttl(interval), load)
+        return Response(content=data, media_type=ARROW_MEDIA_TYPE) if arrow else data
 
     except Exception as e:
         print(f"ERROR: {e}")
         return {
             "dates": [], "prices": [], "sma": [], "ema": [], "rsi": [],
             "recommendation": f"error: {str(e)}"
-        }
\ No newline at end of file
+        }
+
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+
+
+@app.get("/ingest/status")
+def get_ingest_status(request: Request):
+    return request.app.state.ingestor.status()
+
+
+
+@app.get("/prewarm/status")
+def get_prewarm_status(request: Request):
+    return request.app.state.prewarm.status()
+
+
+
+@app.get("/cache/stats")
+def get_cache_stats(request: Request):
+    return request.app.state.history_cache.stats()
@@ -3,6 +3,11 @@ import requests
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import json
+import pandas as pd
+from columnar import ARROW_MEDIA_TYPE, from_arrow
+from bybit_private import BYBIT_DEMO_URL, BybitPrivateSession
+from market_data import MarketData, overview_sources
+from wallet import WalletStore
 
 
 with open('config.json', 'r') as file:
@@ -18,6 +23,16 @@ cryptopanic_token = config.get("CRYPTOPANIC_API_TOKEN")
 
 st.set_page_config(page_title="Crypto Analytics & Trading", layout="wide")
 
+# Сколько точек запрашивать у API для графика и с какого размера переходить на WebGL
+MAX_CHART_POINTS = 2000
+WEBGL_THRESHOLD = 1000
+
+
+def scatter(x, y, **kwargs):
+    trace = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+
 menu = st.sidebar.radio("Меню", [
     "Dashboard",
     "Market Overview",
@@ -27,40 +42,28 @@ menu = st.sidebar.radio("Меню", [
 ])
 
 if menu == "Dashboard":
-    import streamlit as st
-    import requests
-    import pandas as pd
-    from datetime import datetime
-
     st.title("Dashboard")
 
 
-    @st.cache_data
-    def get_transactions(address, api_key):
-        url = (
-            f"https://api.etherscan.io/api"
-            f"?module=account&action=txlist&address={address}"
-            f"&startblock=0&endblock=99999999&sort=asc&apikey={api_key}"
-        )
-        r = requests.get(url).json()
-        if r["status"] != "1":
-            return pd.DataFrame()
-        df = pd.DataFrame(r["result"])
-        df["timeStamp"] = pd.to_datetime(df["timeStamp"], unit='s')
-        df["value_eth"] = df["value"].astype(float) / 1e18
-        df["direction"] = df["from"].apply(lambda x: "OUT" if x.lower() == address.lower() else "IN")
-        return df
-
-
-    txs = get_transactions(eth_address, etherscan_key)
-
-    if txs.empty:
+    @st.cache_resource
+    def wallet_store():
+        return WalletStore()
+
+
+    store = wallet_store()
+    try:
+        # Докачиваются только транзакции из блоков после последней синхронизации
+        store.sync(eth_address, etherscan_key)
+    except Exception as e:
+        st.warning(f"Не удалось обновить транзакции: {e}")
+
+    summary = store.summary(eth_address)
+
+    if not summary["count"]:
         st.error("Не удалось загрузить данные по кошельку.")
     else:
-        latest_balance = txs["value_eth"].where(txs["direction"] == "IN", -txs["value_eth"]).cumsum().iloc[-1]
-        weekly_change = txs[txs["timeStamp"] > (pd.Timestamp.now() - pd.Timedelta(days=7))]
-        delta_weekly = weekly_change["value_eth"].where(weekly_change["direction"] == "IN",
-                                                        -weekly_change["value_eth"]).sum()
+        latest_balance = summary["balance"]
+        delta_weekly = summary["delta"]
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -68,31 +71,35 @@ if menu == "Dashboard":
         with col2:
             st.metric("Капитал", f"${latest_balance * 3100:.2f}", delta=f"${delta_weekly * 3100:+.2f}")
         with col3:
-            st.metric("Транзакций всего", f"{len(txs)}")
+            st.metric("Транзакций всего", f"{summary['count']}")
 
         st.subheader("📈 Equity Curve (баланс по времени)")
-        txs["equity"] = txs["value_eth"].where(txs["direction"] == "IN", -txs["value_eth"]).cumsum()
-        st.line_chart(txs.set_index("timeStamp")["equity"])
+        st.line_chart(store.equity(eth_address, MAX_CHART_POINTS))
 
         st.subheader("📋 Последние транзакции")
-        st.dataframe(
-            txs[["timeStamp", "from", "to", "value_eth", "direction"]].sort_values("timeStamp", ascending=False).head(
-                10),
-            use_container_width=True
-        )
+        st.dataframe(store.latest(eth_address, 10), use_container_width=True)
 
 
 elif menu == "Market Overview":
     st.title("Market Overview")
 
+    @st.cache_resource
+    def market_data(token):
+        # Кэш источников живёт в процессе Streamlit и не сбрасывается при перезапуске скрипта
+        return MarketData(overview_sources(token))
+
+
+    sources = market_data(cryptopanic_token).get_all()
+
+    def source_data(name):
+        result = sources[name]
+        if result["data"] is None:
+            st.warning(f"Источник недоступен: {result['error']}")
+        return result["data"]
+
     st.subheader("Котировки популярных криптовалют")
 
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {
-        "ids": "bitcoin,ethereum,binancecoin,solana,ripple",
-        "vs_currencies": "usd"
-    }
-    response = requests.get(url, params=params).json()
+    response = source_data("prices") or {}
 
     coins_map = {
         "bitcoin": "BTC/USDT",
@@ -107,50 +114,33 @@ elif menu == "Market Overview":
         st.write(f"**{label}**: ${price}")
 
     st.subheader("Индикаторы настроения")
-    fear_greed = requests.get("https://api.alternative.me/fng/").json()
-    value = int(fear_greed["data"][0]["value"])
-    st.progress(value / 100)
-    st.caption(f"Индекс настроения: {fear_greed['data'][0]['value_classification']} ({value}%)")
+    fear_greed = source_data("fear_greed")
+    if fear_greed:
+        value = int(fear_greed["data"][0]["value"])
+        st.progress(value / 100)
+        st.caption(f"Индекс настроения: {fear_greed['data'][0]['value_classification']} ({value}%)")
 
     st.subheader("Объёмы торгов (24ч)")
 
-    volume_url = "https://api.coingecko.com/api/v3/coins/markets"
-    volume_params = {
-        "vs_currency": "usd",
-        "ids": "bitcoin,ethereum,solana"
-    }
-    volumes_data = requests.get(volume_url, params=volume_params).json()
-
-    volume_dict = {
-        coin["symbol"].upper(): [coin["total_volume"]] for coin in volumes_data
-    }
-    st.bar_chart(volume_dict)
+    volumes_data = source_data("volumes")
+    if volumes_data:
+        volume_dict = {
+            coin["symbol"].upper(): [coin["total_volume"]] for coin in volumes_data
+        }
+        st.bar_chart(volume_dict)
 
     st.subheader("Новости / события")
 
-    CRYPTO_PANIC_API_KEY = cryptopanic_token
-
-    news_url = "https://cryptopanic.com/api/v1/posts/"
-    news_params = {
-        "auth_token": CRYPTO_PANIC_API_KEY,
-        "currencies": "BTC,ETH,SOL,XRP,BNB",
-        "public": "true"
-    }
-
-    try:
-        news_response = requests.get(news_url, params=news_params)
-        news_response.raise_for_status()
-        news_data = news_response.json()
-
+    news_data = sources["news"]["data"]
+    if news_data is None:
+        st.error("❌ Не удалось загрузить новости с CryptoPanic.")
+    else:
         for post in news_data.get("results", [])[:5]:
             title = post.get("title", "Без заголовка")
             link = post.get("url", "#")
             published = post.get("published_at", "N/A")
             st.markdown(f"📰 [{title}]({link})\n\n<sub>{published}</sub>", unsafe_allow_html=True)
 
-    except requests.RequestException as e:
-        st.error("❌ Не удалось загрузить новости с CryptoPanic.")
-
 elif menu == "Trading Analysis":
     st.title("Trading Analysis")
 
@@ -223,13 +213,27 @@ elif menu == "Trading Analysis":
                 "show_sma": show_sma,
                 "show_ema": show_ema,
                 "show_rsi": show_rsi,
+                "max_points": MAX_CHART_POINTS,
             }
-            res = requests.get("http://localhost:8000/history", params=params)
-            data = res.json()
+            res = requests.get("http://localhost:8000/history", params=params,
+                               headers={"Accept": ARROW_MEDIA_TYPE})
+            if res.headers.get("content-type", "").startswith(ARROW_MEDIA_TYPE):
+                # Колоночный ответ: даты в epoch ms, значения - массивы float64
+                columns, meta = from_arrow(res.content)
+                data = {
+                    "dates": pd.to_datetime(columns["dates"], unit="ms"),
+                    "prices": columns["prices"],
+                    "sma": columns.get("sma", []),
+                    "ema": columns.get("ema", []),
+                    "rsi": columns.get("rsi", []),
+                    "recommendation": meta["recommendation"]
+                }
+            else:
+                data = res.json()
 
-            if data["dates"]:
+            if len(data["dates"]):
 
-                if data["prices"]:
+                if len(data["prices"]):
                     current_price = data["prices"][-1]
                     previous_price = data["prices"][-2] if len(data["prices"]) >= 2 else current_price
                     price_delta = current_price - previous_price
@@ -247,19 +251,19 @@ elif menu == "Trading Analysis":
                         st.line_chart(data["prices"][-30:])
 
                 fig = go.Figure()
-                fig.add_trace(go.Scatter(x=data["dates"], y=data["prices"], name="Price", line=dict(color="white")))
+                fig.add_trace(scatter(data["dates"], data["prices"], name="Price", line=dict(color="white")))
 
-                if show_sma and data["sma"]:
-                    fig.add_trace(go.Scatter(x=data["dates"], y=data["sma"], name="SMA", line=dict(color="orange")))
-                if show_ema and data["ema"]:
-                    fig.add_trace(go.Scatter(x=data["dates"], y=data["ema"], name="EMA", line=dict(color="purple")))
+                if show_sma and len(data["sma"]):
+                    fig.add_trace(scatter(data["dates"], data["sma"], name="SMA", line=dict(color="orange")))
+                if show_ema and len(data["ema"]):
+                    fig.add_trace(scatter(data["dates"], data["ema"], name="EMA", line=dict(color="purple")))
 
                 fig.update_layout(title=f"{ticker} Price", template="plotly_dark")
                 st.plotly_chart(fig, use_container_width=True)
 
-                if show_rsi and data["rsi"]:
+                if show_rsi and len(data["rsi"]):
                     rsi_fig = go.Figure()
-                    rsi_fig.add_trace(go.Scatter(x=data["dates"], y=data["rsi"], name="RSI", line=dict(color="green")))
+                    rsi_fig.add_trace(scatter(data["dates"], data["rsi"], name="RSI", line=dict(color="green")))
                     rsi_fig.update_layout(title="RSI", template="plotly_dark", height=300)
                     st.plotly_chart(rsi_fig, use_container_width=True)
 
@@ -296,43 +300,85 @@ elif menu == "Backtest":
             "end_date": end_date.strftime("%Y-%m-%d"),
             "timeframe": timeframe
         }
+        st.session_state["backtest_params"] = params
 
         try:
-            res = requests.get("http://localhost:8000/backtest", params=params)
+            # Кривая капитала приходит кусками (NDJSON) и отрисовывается по мере поступления
+            res = requests.get("http://localhost:8000/backtest/stream",
+                               params={**params, "max_points": MAX_CHART_POINTS}, stream=True)
 
             if res.status_code != 200:
                 st.error(f"Ошибка: {res.json()['detail']}")
             else:
-                result = res.json()
-
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=result["timestamps"], y=result["equity_curve"], name="Equity",
-                                         line=dict(color="cyan")))
-                fig.update_layout(title="📈 Кривая капитала", template="plotly_dark")
-                st.plotly_chart(fig, use_container_width=True)
+                chart = st.empty()
+                timestamps, equity_curve, trade_history = [], [], []
+                final_balance = None
+
+                def draw():
+                    fig = go.Figure()
+                    fig.add_trace(scatter(timestamps, equity_curve, name="Equity", line=dict(color="cyan")))
+                    fig.update_layout(title="📈 Кривая капитала", template="plotly_dark")
+                    chart.plotly_chart(fig, use_container_width=True)
+
+                for line in res.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "equity":
+                        timestamps.extend(event["timestamps"])
+                        equity_curve.extend(event["equity_curve"])
+                        draw()
+                    elif event["type"] == "trades":
+                        trade_history.extend(event["trade_history"])
+                    elif event["type"] == "done":
+                        final_balance = event["final_balance"]
+                    elif event["type"] == "error":
+                        st.error(f"Ошибка: {event['detail']}")
 
                 st.subheader("📜 История сделок")
-                st.dataframe(result["trade_history"])
+                st.dataframe(trade_history)
 
-                st.metric("💰 Финальный баланс", f"${result['final_balance']:.2f}")
+                if final_balance is not None:
+                    st.metric("💰 Финальный баланс", f"${final_balance:.2f}")
 
         except Exception as e:
             st.error(f"Ошибка подключения к серверу: {e}")
 
-elif menu == "Trade Monitor":
-    import streamlit as st
-    import requests
-    import time
-    import hmac
-    import hashlib
-    import pandas as pd
+    if "backtest_params" in st.session_state:
+        # Приближение: сервер отдаёт только выбранное окно с полной детализацией в пределах MAX_CHART_POINTS
+        with st.expander("🔍 Детализация окна"):
+            last_params = st.session_state["backtest_params"]
+            col1, col2 = st.columns(2)
+            with col1:
+                window_start = st.date_input("Начало окна", value=datetime.strptime(last_params["start_date"], "%Y-%m-%d"))
+            with col2:
+                window_end = st.date_input("Конец окна", value=datetime.strptime(last_params["end_date"], "%Y-%m-%d"))
+
+            if st.button("Показать окно"):
+                res = requests.get("http://localhost:8000/backtest", params={
+                    **last_params,
+                    "window_start": window_start.strftime("%Y-%m-%d"),
+                    "window_end": (window_end + timedelta(days=1)).strftime("%Y-%m-%d"),
+                    "max_points": MAX_CHART_POINTS
+                }, headers={"Accept": ARROW_MEDIA_TYPE})
+
+                if res.status_code != 200:
+                    st.error(f"Ошибка: {res.json()['detail']}")
+                else:
+                    columns, meta = from_arrow(res.content)
+                    fig = go.Figure()
+                    fig.add_trace(scatter(pd.to_datetime(columns["timestamps"], unit="ms"), columns["equity_curve"],
+                                          name="Equity", line=dict(color="cyan")))
+                    fig.update_layout(title="📈 Кривая капитала (окно)", template="plotly_dark")
+                    st.plotly_chart(fig, use_container_width=True)
 
+elif menu == "Trade Monitor":
     st.header("Trade Monitor")
 
     use_demo = st.checkbox("Использовать демо-счет", value=True)
 
     if use_demo:
-        base_url = "https://api-demo.bybit.com"
+        base_url = BYBIT_DEMO_URL
         API_KEY = demo_bybit_key
         API_SECRET = demo_bybit_secret
     else:
@@ -341,100 +387,19 @@ elif menu == "Trade Monitor":
         API_SECRET = bybit_secret
 
 
-    def sign_request(params):
-        timestamp = str(int(time.time() * 1000))
-        recv_window = "10000"
-        query_string = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
-        string_to_sign = f"{timestamp}{API_KEY}{recv_window}{query_string}"
-        signature = hmac.new(
-            API_SECRET.encode("utf-8"),
-            string_to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
-        headers = {
-            "X-BAPI-API-KEY": API_KEY,
-            "X-BAPI-TIMESTAMP": timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window,
-            "X-BAPI-SIGN": signature,
-            "Content-Type": "application/json"
-        }
-        return headers
-
-
-    def get_order_history(symbol=None):
-        endpoint = "/v5/order/history"
-        url = base_url + endpoint
-        timestamp = str(int(time.time() * 1000))
-        recv_window = "10000"
-
-        params = {
-            "category": "linear",
-            "limit": 50,
-        }
-        if symbol:
-            params["symbol"] = symbol
-
-        import urllib.parse
-        query_string = urllib.parse.urlencode(sorted(params.items()))
-
-        string_to_sign = f"{timestamp}{API_KEY}{recv_window}{query_string}"
-
-        signature = hmac.new(
-            API_SECRET.encode("utf-8"),
-            string_to_sign.encode("utf-8"),
-            hashlib.sha256
-        ).hexdigest()
-
-        headers = {
-            "X-BAPI-API-KEY": API_KEY,
-            "X-BAPI-TIMESTAMP": timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window,
-            "X-BAPI-SIGN": signature,
-            "Content-Type": "application/json"
-        }
-
-        response = requests.get(url + "?" + query_string, headers=headers)
-        if response.status_code != 200:
-            return None, f"HTTP ошибка: {response.status_code}"
-
-        data = response.json()
-        if data.get("retCode") != 0:
-            return None, data.get("retMsg", "Неизвестная ошибка")
-
-        return data.get("result", {}).get("list", []), None
-
+    @st.cache_resource
+    def private_session(base_url, api_key, api_secret):
+        # Одна сессия на процесс Streamlit: соединения и кэш балансов переживают перезапуски скрипта
+        return BybitPrivateSession(api_key, api_secret, base_url=base_url)
 
-    def get_wallet_balance_all_accounts():
-        account_types = ["UNIFIED", "CONTRACT", "SPOT", "FUNDING"]
-        results = {}
 
-        for acc_type in account_types:
-            endpoint = "/v5/account/wallet-balance"
-            url = base_url + endpoint
-
-            params = {
-                "accountType": acc_type
-            }
-
-            headers = sign_request(params)
-            response = requests.get(url, headers=headers, params=params)
-
-            if response.status_code == 200:
-                data = response.json()
-                if data["retCode"] == 0 and data["result"]["list"]:
-                    results[acc_type] = data["result"]["list"][0]["coin"]
-                else:
-                    results[acc_type] = []
-            else:
-                results[acc_type] = f"Ошибка {response.status_code}"
-
-        return results
+    client = private_session(base_url, API_KEY, API_SECRET)
 
 
     tabs = st.tabs(["📊 Баланс", "📑 История ордеров", "💼 Торговля", "🤖 Торговый бот"])
 
     with tabs[0]:
-        balances = get_wallet_balance_all_accounts()
+        balances = client.get_wallet_balance_all_accounts()
 
         for acc_type, coins in balances.items():
             st.markdown(f"### 🧾 {acc_type} Account")
@@ -453,7 +418,7 @@ elif menu == "Trade Monitor":
     with tabs[1]:
         st.subheader("📑 История ордеров (последние 20)")
         with st.spinner("Загружаем историю ордеров..."):
-            orders, error = get_order_history()
+            orders, error = client.get_order_history()
 
         if error:
             st.error(error)
@@ -476,58 +441,8 @@ elif menu == "Trade Monitor":
             submit_order = st.form_submit_button("Разместить ордер")
 
         if submit_order:
-            import json
-
-
-            def place_order():
-                endpoint = "/v5/order/create"
-                url = base_url + endpoint
-
-                body = {
-                    "category": "linear",
-                    "symbol": symbol,
-                    "side": side,
-                    "orderType": order_type,
-                    "qty": str(qty),
-                    "timeInForce": "GoodTillCancel"
-                }
-
-                if order_type == "Limit":
-                    if price <= 0:
-                        st.error("Для лимитного ордера цена должна быть больше 0")
-                        return
-                    body["price"] = str(price)
-
-                timestamp = str(int(time.time() * 1000))
-                recv_window = "10000"
-
-                # Сериализуем тело запроса в JSON без пробелов, с сортировкой ключей
-                body_json = json.dumps(body, separators=(',', ':'), sort_keys=True)
-
-                string_to_sign = f"{timestamp}{API_KEY}{recv_window}{body_json}"
-
-                signature = hmac.new(
-                    API_SECRET.encode("utf-8"),
-                    string_to_sign.encode("utf-8"),
-                    hashlib.sha256
-                ).hexdigest()
-
-                headers = {
-                    "X-BAPI-API-KEY": API_KEY,
-                    "X-BAPI-TIMESTAMP": timestamp,
-                    "X-BAPI-RECV-WINDOW": recv_window,
-                    "X-BAPI-SIGN": signature,
-                    "Content-Type": "application/json"
-                }
-
-                response = requests.post(url, headers=headers,
-                                         data=body_json)  # тело запроса передаем в data (json-строка)
-
-                return response.json()
-
-
             with st.spinner("Отправка ордера..."):
-                result = place_order()
+                result = client.create_order(symbol, side, qty, order_type=order_type, timeInForce="GoodTillCancel")
                 if result.get("retCode") == 0:
                     st.success(f"Ордер размещен: {result['result']['orderId']}")
                 else:
@@ -539,11 +454,13 @@ elif menu == "Trade Monitor":
 
         if bot_enabled:
             symbol_bot = st.text_input("Монета", "BTCUSDT")
+            st.caption("Бот запускается отдельным процессом на закрытых свечах:")
+            st.code(f"python live.py --bot SimpleBot --symbol {symbol_bot} --interval 1 --mode {'demo' if use_demo else 'live'}")
             btn_refresh = st.button("Обновить историю торговли бота")
 
             if btn_refresh:
                 with st.spinner("Загружаем историю торговли..."):
-                    orders, error = get_order_history(symbol=symbol_bot)
+                    orders, error = client.get_order_history(symbol=symbol_bot)
                     if error:
                         st.error(error)
                     elif not orders:
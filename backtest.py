@@ -1,10 +1,40 @@
-import requests
+import numpy as np
 import pandas as pd
 import time
+import cProfile
+from storage import CandleStore, TIMEFRAME_MS
+from bybit import BULK, market_client
+from metrics import timed
+from profiling import RunProfile
+
+
+INTERVAL_MAP = {
+    "1m": "1",
+    "5m": "5",
+    "15m": "15",
+    "30m": "30",
+    "1h": "60",
+    "1d": "D"
+}
+
+DEFAULT_STORE = CandleStore()
+
+BUY, SELL = 1, -1
+SIDES = {BUY: 'BUY', SELL: 'SELL'}
+
+# Журнал сделок: время в epoch ms, сторона (BUY/SELL), цена
+TRADE_DTYPE = np.dtype([("timestamp", np.int64), ("side", np.int8), ("price", np.float64)])
 
 
 class ExchangeSimulator:
-    def __init__(self, symbol="BTCUSDT", timeframe="1d", start_balance=10000):
+    # Данные хранятся и как DataFrame (для ботов), и как непрерывные NumPy-колонки для горячего цикла
+    __slots__ = (
+        "symbol", "timeframe", "balance", "position", "entry_price", "fee", "current_idx", "store", "intrabar",
+        "_data", "timestamp", "open", "high", "low", "close", "volume", "fill", "trades", "trade_count"
+    )
+
+    # intrabar=True: сделка исполняется не по закрытию бара, а по закрытию его первой минутной свечи
+    def __init__(self, symbol="BTCUSDT", timeframe="1d", start_balance=10000, store=DEFAULT_STORE, intrabar=False):
         self.symbol = symbol
         self.timeframe = timeframe
         self.balance = start_balance
@@ -13,93 +43,150 @@ class ExchangeSimulator:
         self.fee = 0.001
         self.data = None
         self.current_idx = 0
-        self.history = []
+        self.trades = np.empty(64, dtype=TRADE_DTYPE)
+        self.trade_count = 0
+        self.store = store
+        self.intrabar = intrabar
 
-    def load_data(self, start_date=None, end_date=None):
-        interval_map = {
-            "1m": "1",
-            "5m": "5",
-            "15m": "15",
-            "30m": "30",
-            "1h": "60",
-            "1d": "D"
-        }
-
-        if self.timeframe not in interval_map:
-            raise Exception(f"Unsupported timeframe: {self.timeframe}")
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        if data is None:
+            self.timestamp = np.empty(0, dtype=np.int64)
+            self.open = self.high = self.low = self.close = self.volume = self.fill = np.empty(0, dtype=np.float64)
+            return
+        self.timestamp = data["timestamp"].to_numpy(dtype="datetime64[ms]").view(np.int64)
+        self.open = data["open"].to_numpy(dtype=np.float64)
+        self.high = data["high"].to_numpy(dtype=np.float64)
+        self.low = data["low"].to_numpy(dtype=np.float64)
+        self.close = data["close"].to_numpy(dtype=np.float64)
+        self.volume = data["volume"].to_numpy(dtype=np.float64)
+        # Цена исполнения сделок на каждом баре
+        self.fill = self.close
+
+    def set_intrabar_fills(self, minutes):
+        # Бот решает на баре idx по барам до idx-1, поэтому первая доступная цена - закрытие
+        # первой минуты бара idx. Если минут внутри бара нет, остаётся закрытие бара
+        minute_ts = minutes["timestamp"].to_numpy(dtype="datetime64[ms]").view(np.int64)
+        minute_close = minutes["close"].to_numpy(dtype=np.float64)
+        if not len(minute_ts):
+            return
+        idx = np.minimum(np.searchsorted(minute_ts, self.timestamp), len(minute_ts) - 1)
+        inside = (minute_ts[idx] >= self.timestamp) & (minute_ts[idx] < self.timestamp + TIMEFRAME_MS[self.timeframe])
+        self.fill = np.where(inside, minute_close[idx], self.close)
 
-        interval = interval_map[self.timeframe]
+    @property
+    def history(self):
+        trades = self.trades[:self.trade_count]
+        times = pd.to_datetime(trades["timestamp"], unit="ms")
+        return [(t, SIDES[side], price) for t, side, price in zip(times, trades["side"].tolist(), trades["price"])]
+
+    def record_trades(self, timestamps, sides, prices):
+        count = self.trade_count + len(timestamps)
+        if count > len(self.trades):
+            grown = np.empty(max(count, 2 * len(self.trades)), dtype=TRADE_DTYPE)
+            grown[:self.trade_count] = self.trades[:self.trade_count]
+            self.trades = grown
+        log = self.trades[self.trade_count:count]
+        log["timestamp"] = timestamps
+        log["side"] = sides
+        log["price"] = prices
+        self.trade_count = count
+
+    def _range(self, start_date, end_date):
+        if self.timeframe not in INTERVAL_MAP:
+            raise Exception(f"Unsupported timeframe: {self.timeframe}")
 
         start_ts = int(pd.Timestamp(start_date).timestamp() * 1000)
         end_ts = int(pd.Timestamp(end_date).timestamp() * 1000)
-        all_data = []
+        return start_ts, end_ts
 
-        while start_ts < end_ts:
-            url = "https://api.bybit.com/v5/market/kline"
-            params = {
-                "category": "linear",
-                "symbol": self.symbol,
-                "interval": interval,
-                "start": start_ts,
-                "limit": 200
-            }
+    def _set_loaded(self, data, minutes=None):
+        if data.empty:
+            raise Exception("No data fetched from Bybit.")
 
-            res = requests.get(url, params=params)
-            if res.status_code != 200:
-                raise Exception(f"Bybit API error: {res.status_code} {res.text}")
+        self.data = data.reset_index(drop=True)
+        if minutes is not None:
+            self.set_intrabar_fills(minutes)
 
-            data = res.json().get("result", {}).get("list", [])
-            if not data:
-                break
+    def _minutes_range(self, end_ts):
+        # Нужны ли минутные свечи для исполнения и до какого момента
+        if not self.intrabar or self.timeframe == "1m":
+            return None
+        return end_ts
 
-            data.reverse()
+    def load_data(self, start_date=None, end_date=None):
+        start_ts, end_ts = self._range(start_date, end_date)
 
-            df = pd.DataFrame(data, columns=[
-                "timestamp", "open", "high", "low", "close", "volume","turnover"
-            ])
-            df["timestamp"] = pd.to_datetime(df["timestamp"].astype(float), unit="ms")
-            df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].astype(float)
-            all_data.append(df[["timestamp", "open", "high", "low", "close", "volume"]])
+        minutes_end = self._minutes_range(end_ts)
+        minutes = None
+        with timed("load_data"):
+            if self.store is None:
+                data = self.fetch_range(start_ts, end_ts)
+                if minutes_end is not None:
+                    minutes = self.fetch_range(start_ts, minutes_end, "1m")
+            else:
+                data = self.store.load(self.symbol, self.timeframe, start_ts, end_ts, self.fetch_range)
+                if minutes_end is not None:
+                    minutes = self.store.load(self.symbol, "1m", start_ts, minutes_end, self.fetch_range)
 
-            last_ts = int(data[-1][0])
-            if last_ts == start_ts:
-                break
-            start_ts = last_ts + 1
+        self._set_loaded(data, minutes)
 
+    async def load_data_async(self, client, start_date=None, end_date=None):
+        start_ts, end_ts = self._range(start_date, end_date)
 
-            time.sleep(0.5)
+        async def fetch(range_start, range_end, timeframe=None):
+            return await self.fetch_range_async(client, range_start, range_end, timeframe)
 
-        if not all_data:
-            raise Exception("No data fetched from Bybit.")
+        minutes_end = self._minutes_range(end_ts)
+        minutes = None
+        with timed("load_data"):
+            if self.store is None:
+                data = await fetch(start_ts, end_ts)
+                if minutes_end is not None:
+                    minutes = await fetch(start_ts, minutes_end, "1m")
+            else:
+                data = await self.store.load_async(self.symbol, self.timeframe, start_ts, end_ts, fetch)
+                if minutes_end is not None:
+                    minutes = await self.store.load_async(self.symbol, "1m", start_ts, minutes_end, fetch)
+
+        self._set_loaded(data, minutes)
 
-        self.data = pd.concat(all_data).reset_index(drop=True)
-        self.data = self.data[self.data["timestamp"] <= pd.to_datetime(end_date)]
+    def fetch_range(self, start_ts, end_ts, timeframe=None):
+        return market_client().get_klines_sync(self.symbol, INTERVAL_MAP[timeframe or self.timeframe], start_ts, end_ts)
+
+    async def fetch_range_async(self, client, start_ts, end_ts, timeframe=None):
+        return await client.get_klines(self.symbol, INTERVAL_MAP[timeframe or self.timeframe], start_ts, end_ts, priority=BULK)
 
     def get_current_price(self):
-        return self.data.iloc[self.current_idx]["close"]
+        return self.close[self.current_idx]
 
     def buy(self):
         if self.position == 0:
-            price = self.get_current_price()
+            price = self.fill[self.current_idx]
             self.position = self.balance * (1 - self.fee) / price
             self.balance = 0
             self.entry_price = price
-            self.history.append((self.data.iloc[self.current_idx]['timestamp'], 'BUY', price))
+            self.record_trades([self.timestamp[self.current_idx]], [BUY], [price])
 
     def sell(self):
         if self.position > 0:
-            price = self.get_current_price()
+            price = self.fill[self.current_idx]
             self.balance = self.position * price * (1 - self.fee)
             self.position = 0
             self.entry_price = 0
-            self.history.append((self.data.iloc[self.current_idx]['timestamp'], 'SELL', price))
+            self.record_trades([self.timestamp[self.current_idx]], [SELL], [price])
 
     def next_step(self):
         self.current_idx += 1
 
     def get_equity(self):
         if self.position > 0:
-            return self.balance + self.position * self.get_current_price()
+            return self.balance + self.position * self.close[self.current_idx]
         else:
             return self.balance
 
@@ -108,12 +195,144 @@ class BacktestManager:
     def __init__(self, exchange, bot):
         self.exchange = exchange
         self.bot = bot
-        self.equity_curve = []
-        self.timestamps = []
-
-    def run(self):
-        while self.exchange.current_idx < len(self.exchange.data) - 1:
-            self.bot.tick()
-            self.equity_curve.append(self.exchange.get_equity())
-            self.timestamps.append(self.exchange.data.iloc[self.exchange.current_idx]['timestamp'])
-            self.exchange.next_step()
+        # Кривая капитала (float64) и метки времени баров в epoch ms (int64)
+        self.equity_curve = np.empty(0, dtype=np.float64)
+        self.timestamps = np.empty(0, dtype=np.int64)
+
+    def allocate(self, steps):
+        offset = len(self.equity_curve)
+        self.equity_curve = np.concatenate((self.equity_curve, np.empty(steps, dtype=np.float64)))
+        self.timestamps = np.concatenate((self.timestamps, np.empty(steps, dtype=np.int64)))
+        return offset
+
+    @timed("backtest_run")
+    def run(self, vectorized=False):
+        if vectorized:
+            with timed("signals"):
+                signals = self.bot.signals(self.exchange.data) if hasattr(self.bot, "signals") else None
+            if signals is not None:
+                return self.run_vectorized(signals)
+
+        exchange = self.exchange
+        stop = len(exchange.timestamp) - 1
+        i = self.allocate(max(stop - exchange.current_idx, 0))
+        equity_curve, timestamps = self.equity_curve, self.timestamps
+        tick, get_equity, next_step = self.bot.tick, exchange.get_equity, exchange.next_step
+
+        while exchange.current_idx < stop:
+            tick()
+            equity_curve[i] = get_equity()
+            timestamps[i] = exchange.timestamp[exchange.current_idx]
+            next_step()
+            i += 1
+
+    def profile(self, vectorized=False, cprofile=True):
+        # Тот же прогон, что run, но с замером каждого тика и (опционально) cProfile.
+        # Медленнее обычного run, задержки тиков включают накладные расходы профилировщика
+        exchange = self.exchange
+        profiler = cProfile.Profile() if cprofile else None
+        tick_ns = np.empty(0, dtype=np.int64)
+        perf_counter_ns = time.perf_counter_ns
+
+        started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            signals = self.bot.signals(exchange.data) if vectorized and hasattr(self.bot, "signals") else None
+            if signals is not None:
+                self.run_vectorized(signals)
+            else:
+                stop = len(exchange.timestamp) - 1
+                steps = max(stop - exchange.current_idx, 0)
+                i = self.allocate(steps)
+                tick_ns = np.empty(steps, dtype=np.int64)
+                equity_curve, timestamps = self.equity_curve, self.timestamps
+                tick, get_equity, next_step = self.bot.tick, exchange.get_equity, exchange.next_step
+
+                for j in range(steps):
+                    tick_started = perf_counter_ns()
+                    tick()
+                    tick_ns[j] = perf_counter_ns() - tick_started
+                    equity_curve[i + j] = get_equity()
+                    timestamps[i + j] = exchange.timestamp[exchange.current_idx]
+                    next_step()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+        return RunProfile(tick_ns, time.perf_counter() - started, profiler)
+
+    def iter_run(self, chunk_size=10000, vectorized=False):
+        # Отдаёт куски (метки времени, капитал, новые сделки) по мере расчёта.
+        # Буферы переиспользуются между кусками: потребитель должен обработать кусок до следующего шага
+        exchange = self.exchange
+        traded = exchange.trade_count
+
+        if vectorized:
+            signals = self.bot.signals(exchange.data) if hasattr(self.bot, "signals") else None
+            if signals is not None:
+                offset = len(self.equity_curve)
+                self.run_vectorized(signals)
+                trades = exchange.trades[traded:exchange.trade_count]
+                for start in range(offset, len(self.equity_curve), chunk_size):
+                    end = min(start + chunk_size, len(self.equity_curve))
+                    chunk_trades = trades[(trades["timestamp"] >= self.timestamps[start]) & (trades["timestamp"] <= self.timestamps[end - 1])]
+                    yield self.timestamps[start:end], self.equity_curve[start:end], chunk_trades
+                return
+
+        stop = len(exchange.timestamp) - 1
+        equity_curve = np.empty(chunk_size, dtype=np.float64)
+        timestamps = np.empty(chunk_size, dtype=np.int64)
+        tick, get_equity, next_step = self.bot.tick, exchange.get_equity, exchange.next_step
+
+        i = 0
+        while exchange.current_idx < stop:
+            tick()
+            equity_curve[i] = get_equity()
+            timestamps[i] = exchange.timestamp[exchange.current_idx]
+            next_step()
+            i += 1
+            if i == chunk_size or exchange.current_idx == stop:
+                yield timestamps[:i], equity_curve[:i], exchange.trades[traded:exchange.trade_count]
+                traded = exchange.trade_count
+                i = 0
+
+    def run_vectorized(self, signals):
+        # signals[i] - целевая позиция после тика на баре i: 1 - в позиции, 0 - вне позиции, NaN - без изменений
+        exchange = self.exchange
+        start, stop = exchange.current_idx, len(exchange.timestamp) - 1
+        if start >= stop:
+            return
+
+        close = exchange.close[start:stop]
+        in_position = exchange.position > 0
+        target = pd.Series(np.asarray(signals, dtype=float)[start:stop]).ffill().fillna(float(in_position)).to_numpy()
+
+        previous = np.concatenate(([float(in_position)], target[:-1]))
+        trades = np.flatnonzero(target != previous)
+        is_buy = target[trades] == 1
+        prices = exchange.fill[start:stop][trades]
+
+        # Стоимость после каждой сделки: монеты после покупки, деньги после продажи
+        factors = np.where(is_buy, (1 - exchange.fee) / prices, prices * (1 - exchange.fee))
+        initial = exchange.position if in_position else exchange.balance
+        held = np.concatenate(([initial], initial * np.cumprod(factors)))
+        held = held[np.cumsum(target != previous)]
+        equity = np.where(target == 1, held * close, held)
+
+        timestamps = exchange.timestamp[start:stop]
+        exchange.record_trades(timestamps[trades], np.where(is_buy, BUY, SELL), prices)
+        offset = self.allocate(stop - start)
+        self.equity_curve[offset:] = equity
+        self.timestamps[offset:] = timestamps
+
+        exchange.current_idx = stop
+        if target[-1] == 1:
+            exchange.position = held[-1]
+            exchange.balance = 0
+            if len(trades):
+                exchange.entry_price = prices[-1]
+        else:
+            exchange.balance = held[-1]
+            exchange.position = 0
+            exchange.entry_price = 0
@@ -0,0 +1,220 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from backtest import ExchangeSimulator, BacktestManager
+from bots import BOTS
+from bs import compute_rsi, compute_macd, RSI, MACD, RollingMean
+from downsample import minmax_indices
+from synthetic import synthetic_ohlcv
+
+
+DEFAULT_SIZES = "1k,10k,100k,1m,5m"
+BASELINE_PATH = "bench_baseline.json"
+CHECK_SIZE = "20k"
+# Допустимое относительное расхождение в проверках эквивалентности (ошибки округления)
+CHECK_TOLERANCE = 1e-9
+VECTORIZED_BOTS = [name for name, bot in BOTS.items() if hasattr(bot, "signals")]
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1], 1)
+    return int(float(value.rstrip("km")) * multiplier)
+
+
+def simulator(data):
+    exchange = ExchangeSimulator(store=None)
+    exchange.data = data
+    return exchange
+
+
+def backtest(data, name, vectorized):
+    exchange = simulator(data)
+    manager = BacktestManager(exchange, BOTS[name](exchange))
+    # SmartBot печатает каждую сделку
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.run(vectorized=vectorized)
+    return exchange, manager
+
+
+def run_bot(name, vectorized):
+    return lambda data: backtest(data, name, vectorized)
+
+
+def stream(indicator_factory):
+    def case(data):
+        indicator = indicator_factory()
+        update = indicator.update
+        for price in data["close"].to_numpy().tolist():
+            update(price)
+    return case
+
+
+CASES = {
+    "compute_rsi": lambda data: compute_rsi(data["close"]),
+    "compute_macd": lambda data: compute_macd(data["close"]),
+    "stream_rsi": stream(RSI),
+    "stream_macd": stream(MACD),
+    "stream_rolling_mean": stream(lambda: RollingMean(20)),
+    "minmax_downsample": lambda data: minmax_indices(data["close"].to_numpy(), 2000),
+    **{f"loop_{name}": run_bot(name, vectorized=False) for name in BOTS},
+    **{f"vectorized_{name}": run_bot(name, vectorized=True) for name in VECTORIZED_BOTS}
+}
+
+
+def relative_diff(actual, expected):
+    # Максимальное расхождение относительно масштаба ряда; NaN должны стоять на тех же местах
+    actual, expected = np.asarray(actual, dtype=float), np.asarray(expected, dtype=float)
+    if actual.shape != expected.shape or not np.array_equal(np.isnan(actual), np.isnan(expected)):
+        return float("inf")
+    valid = ~np.isnan(expected)
+    if not valid.any():
+        return 0.0
+    scale = max(np.abs(expected[valid]).max(), 1e-12)
+    return float(np.abs(actual[valid] - expected[valid]).max() / scale)
+
+
+def check_vectorized(data):
+    # Векторный режим должен давать те же сделки и ту же кривую капитала, что и цикл по барам
+    failures = []
+    for name in VECTORIZED_BOTS:
+        loop, loop_manager = backtest(data, name, vectorized=False)
+        fast, fast_manager = backtest(data, name, vectorized=True)
+        loop_trades, fast_trades = loop.trades[:loop.trade_count], fast.trades[:fast.trade_count]
+        if not np.array_equal(loop_trades, fast_trades):
+            failures.append(f"{name}: trades differ ({loop.trade_count} loop, {fast.trade_count} vectorized)")
+        diff = relative_diff(fast_manager.equity_curve, loop_manager.equity_curve)
+        if diff > CHECK_TOLERANCE:
+            failures.append(f"{name}: equity differs by {diff:.2e}")
+    return failures
+
+
+def check_streaming(data):
+    # Потоковые индикаторы по одному бару должны совпадать с pandas-версиями на всём ряду
+    close = data["close"]
+    prices = close.to_numpy().tolist()
+    rsi, macd, mean = RSI(), MACD(), RollingMean(20)
+    stream_macd = np.array([macd.update(price) for price in prices])
+    macd_line, signal_line = compute_macd(close)
+    pairs = {
+        "RSI": ([rsi.update(price) for price in prices], compute_rsi(close)),
+        "MACD": (stream_macd[:, 0], macd_line),
+        "MACD signal": (stream_macd[:, 1], signal_line),
+        "RollingMean(20)": ([mean.update(price) for price in prices], close.rolling(window=20).mean())
+    }
+    failures = []
+    for name, (actual, expected) in pairs.items():
+        diff = relative_diff(actual, expected)
+        if diff > CHECK_TOLERANCE:
+            failures.append(f"{name}: differs by {diff:.2e}")
+    return failures
+
+
+CHECKS = {
+    "vectorized": check_vectorized,
+    "streaming": check_streaming
+}
+
+
+def measure(case, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        case(data)
+        timings.append(time.perf_counter() - started)
+
+    # Память меряется отдельным прогоном: tracemalloc замедляет выполнение
+    gc.collect()
+    tracemalloc.start()
+    case(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    return {"seconds": best, "ns_per_bar": best / len(data) * 1e9, "peak_mb": peak / 2 ** 20}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        ratio = result["ns_per_bar"] / reference["ns_per_bar"]
+        result["vs_baseline"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки индикаторов, ботов и цикла бэктеста на синтетических данных")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="размеры рядов через запятую, например 1k,100k,5m")
+    parser.add_argument("--cases", default="", help="подстроки имён кейсов через запятую (по умолчанию все)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как новый baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление относительно baseline")
+    parser.add_argument("--check", nargs="?", const=CHECK_SIZE, metavar="SIZE",
+                        help=f"вместо замеров проверить эквивалентность быстрых путей (по умолчанию {CHECK_SIZE} баров)")
+    args = parser.parse_args(argv)
+
+    filters = [f for f in args.cases.split(",") if f]
+    if args.check is not None:
+        return run_checks(parse_size(args.check), args.seed, filters)
+    cases = {name: case for name, case in CASES.items() if not filters or any(f in name for f in filters)}
+
+    results = {}
+    print(f"{'case':<32}{'bars':>10}{'ns/bar':>12}{'peak MB':>10}")
+    for size in map(parse_size, args.sizes.split(",")):
+        data = synthetic_ohlcv(size, seed=args.seed)
+        for name, case in cases.items():
+            key = f"{name}@{size}"
+            results[key] = measure(case, data, args.repeat)
+            print(f"{name:<32}{size:>10}{results[key]['ns_per_bar']:>12.1f}{results[key]['peak_mb']:>10.1f}")
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for key, ratio in regressions:
+            print(f"REGRESSION {key}: {ratio:.2f}x slower than baseline")
+        return 1 if regressions else 0
+    return 0
+
+
+def run_checks(size, seed, filters):
+    data = synthetic_ohlcv(size, seed=seed)
+    failed = False
+    for name, check in CHECKS.items():
+        if filters and not any(f in name for f in filters):
+            continue
+        failures = check(data)
+        print(f"{name:<32}{'FAIL' if failures else 'OK'}")
+        for failure in failures:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
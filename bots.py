@@ -1,21 +1,54 @@
-from bs import compute_rsi, compute_macd
+import numpy as np
+from bs import RSI, MACD, RollingMean
 
 
-class SmartBot:
-    def __init__(self, exchange, rsi_window=14, macd_short_window=12, macd_long_window=26, macd_signal_window=9):
+class StreamingBot:
+    # Индикаторы обновляются по одному бару: перед тиком на баре idx в них попадают бары до idx - 1
+    def __init__(self, exchange):
         self.exchange = exchange
+        self.source = None
+        self.fed = 0
+
+    def reset_indicators(self):
+        raise NotImplementedError
+
+    def update_indicators(self, idx):
+        raise NotImplementedError
+
+    def catch_up(self):
+        if self.exchange.close is not self.source or self.exchange.current_idx < self.fed:
+            self.source = self.close = self.exchange.close
+            self.volume = self.exchange.volume
+            self.fed = 0
+            self.reset_indicators()
+        while self.fed < self.exchange.current_idx:
+            self.update_indicators(self.fed)
+            self.fed += 1
+
+
+class SmartBot(StreamingBot):
+    def __init__(self, exchange, rsi_window=14, macd_short_window=12, macd_long_window=26, macd_signal_window=9):
+        super().__init__(exchange)
         self.rsi_window = rsi_window
         self.macd_short_window = macd_short_window
         self.macd_long_window = macd_long_window
         self.macd_signal_window = macd_signal_window
 
+    def reset_indicators(self):
+        self.rsi = RSI(self.rsi_window)
+        self.macd = MACD(self.macd_short_window, self.macd_long_window, self.macd_signal_window)
+
+    def update_indicators(self, idx):
+        self.rsi.update(self.close[idx])
+        self.macd.update(self.close[idx])
+
     def tick(self):
+        self.catch_up()
         if self.exchange.current_idx < max(self.rsi_window, self.macd_long_window):
             return
 
-        recent_data = self.exchange.data.iloc[self.exchange.current_idx - max(self.rsi_window, self.macd_long_window):self.exchange.current_idx]
-        rsi = compute_rsi(recent_data['close'], self.rsi_window).iloc[-1]
-        macd, macd_signal = compute_macd(recent_data['close'], self.macd_short_window, self.macd_long_window, self.macd_signal_window)
+        rsi = self.rsi.value
+        macd, macd_signal = self.macd.value
 
         if rsi < 30 and self.exchange.position == 0: 
             print(f"RSI: {rsi:.2f} - Покупка!")
@@ -25,36 +58,52 @@ class SmartBot:
             print(f"RSI: {rsi:.2f} - Продажа!")
             self.exchange.sell()
 
-        if macd.iloc[-1] > macd_signal.iloc[-1] and self.exchange.position == 0: 
+        if macd > macd_signal and self.exchange.position == 0: 
             print(f"MACD: Покупка!")
             self.exchange.buy()
 
-        elif macd.iloc[-1] < macd_signal.iloc[-1] and self.exchange.position > 0: 
+        elif macd < macd_signal and self.exchange.position > 0: 
             print(f"MACD: Продажа!")
             self.exchange.sell()
 
 
-class SimpleBot:
+class SimpleBot(StreamingBot):
     def __init__(self, exchange, ma_short=5, ma_long=20):
-        self.exchange = exchange
+        super().__init__(exchange)
         self.ma_short = ma_short
         self.ma_long = ma_long
 
+    def reset_indicators(self):
+        self.short_ma = RollingMean(self.ma_short)
+        self.long_ma = RollingMean(self.ma_long)
+
+    def update_indicators(self, idx):
+        self.short_ma.update(self.close[idx])
+        self.long_ma.update(self.close[idx])
+
     def tick(self):
+        self.catch_up()
         if self.exchange.current_idx < self.ma_long:
             return
-        recent_data = self.exchange.data.iloc[self.exchange.current_idx - self.ma_long:self.exchange.current_idx]
-        short_ma = recent_data['close'].tail(self.ma_short).mean()
-        long_ma = recent_data['close'].mean()
+        short_ma = self.short_ma.value
+        long_ma = self.long_ma.value
         if short_ma > long_ma and self.exchange.position == 0:
             self.exchange.buy()
         elif short_ma < long_ma and self.exchange.position > 0:
             self.exchange.sell()
 
+    def signals(self, data):
+        close = data['close']
+        short_ma = close.rolling(self.ma_short).mean().shift(1).to_numpy()
+        long_ma = close.rolling(self.ma_long).mean().shift(1).to_numpy()
+        target = np.where(short_ma > long_ma, 1.0, np.where(short_ma < long_ma, 0.0, np.nan))
+        target[:self.ma_long] = np.nan
+        return target
+
 
-class ModernRSIVolumeBot:
+class ModernRSIVolumeBot(StreamingBot):
     def __init__(self, exchange, rsi_period=14, rsi_buy=30, rsi_sell=70, volume_multiplier=1.5):
-        self.exchange = exchange
+        super().__init__(exchange)
         self.rsi_period = rsi_period
         self.rsi_buy = rsi_buy
         self.rsi_sell = rsi_sell
@@ -72,17 +121,22 @@ class ModernRSIVolumeBot:
         rsi = 100 - (100 / (1 + rs))
         return rsi
 
+    def reset_indicators(self):
+        self.rsi = RSI(self.rsi_period, min_periods=1, eps=1e-9)
+        self.average_volume = RollingMean(20, min_periods=1)
+
+    def update_indicators(self, idx):
+        self.rsi.update(self.close[idx])
+        self.average_volume.update(self.volume[idx])
+
     def tick(self):
+        self.catch_up()
         if self.exchange.current_idx < self.rsi_period + 1:
             return
 
-        data = self.exchange.data.iloc[:self.exchange.current_idx]
-        close = data['close']
-        volume = data['volume']
-
-        rsi = self.compute_rsi(close).iloc[-1]
-        recent_volume = volume.iloc[-1]
-        average_volume = volume.tail(20).mean()
+        rsi = self.rsi.value
+        recent_volume = self.volume[self.exchange.current_idx - 1]
+        average_volume = self.average_volume.value
 
         volume_spike = recent_volume > average_volume * self.volume_multiplier
 
@@ -90,4 +144,30 @@ class ModernRSIVolumeBot:
             self.exchange.buy()
 
         elif rsi > self.rsi_sell and self.exchange.position > 0:
-            self.exchange.sell()
\ No newline at end of file
+            self.exchange.sell()
+
+    def signals(self, data):
+        # При rsi_buy > rsi_sell условия покупки и продажи пересекаются и зависят от позиции
+        if self.rsi_buy > self.rsi_sell:
+            return None
+
+        close = data['close']
+        volume = data['volume']
+        rsi = self.compute_rsi(close).shift(1).to_numpy()
+        recent_volume = volume.shift(1).to_numpy()
+        average_volume = volume.rolling(20, min_periods=1).mean().shift(1).to_numpy()
+
+        volume_spike = recent_volume > average_volume * self.volume_multiplier
+        buy = (rsi < self.rsi_buy) & volume_spike
+        sell = rsi > self.rsi_sell
+
+        target = np.where(buy, 1.0, np.where(sell, 0.0, np.nan))
+        target[:self.rsi_period + 1] = np.nan
+        return target
+
+
+BOTS = {
+    "SmartBot": SmartBot,
+    "SimpleBot": SimpleBot,
+    "ModernRSIVolumeBot": ModernRSIVolumeBot
+}
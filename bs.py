@@ -1,5 +1,9 @@
+import math
+from collections import deque
 import pandas as pd
+from metrics import timed
 
+@timed("compute_rsi")
 def compute_rsi(data: pd.Series, window: int = 14) -> pd.Series:
     delta = data.diff()
     gain = delta.where(delta > 0, 0.0)
@@ -9,9 +13,96 @@ def compute_rsi(data: pd.Series, window: int = 14) -> pd.Series:
     rs = avg_gain / avg_loss
     return 100 - (100 / (1 + rs))
 
+def add_indicators(df, sma=True, ema=True, rsi=True):
+    # Индикаторы графика /history по колонке Close; невыбранные остаются None
+    df["SMA"] = df["Close"].rolling(window=5).mean() if sma else None
+    df["EMA"] = df["Close"].ewm(span=5, adjust=False).mean() if ema else None
+    df["RSI"] = compute_rsi(df["Close"]) if rsi else None
+    return df
+
+@timed("compute_macd")
 def compute_macd(data: pd.Series, short_window: int = 12, long_window: int = 26, signal_window: int = 9):
     short_ema = data.ewm(span=short_window, adjust=False).mean()
     long_ema = data.ewm(span=long_window, adjust=False).mean()
     macd = short_ema - long_ema
     signal = macd.ewm(span=signal_window, adjust=False).mean()
     return macd, signal
+
+
+# Потоковые индикаторы: O(1) на новый бар, значения совпадают с pandas-версиями выше
+
+class RollingMean:
+    def __init__(self, window, min_periods=None):
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self.values = deque()
+        self.total = 0.0
+        self.updates = 0
+
+    def update(self, value):
+        self.values.append(value)
+        self.total += value
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+        self.updates += 1
+        # Периодический пересчёт суммы, чтобы не копилась ошибка округления
+        if self.updates % self.window == 0:
+            self.total = math.fsum(self.values)
+        return self.value
+
+    @property
+    def value(self):
+        if len(self.values) < self.min_periods:
+            return math.nan
+        return self.total / len(self.values)
+
+
+class RSI:
+    def __init__(self, window=14, min_periods=None, eps=0.0):
+        self.eps = eps
+        self.avg_gain = RollingMean(window, min_periods)
+        self.avg_loss = RollingMean(window, min_periods)
+        self.last = None
+
+    def update(self, price):
+        # Как и в compute_rsi, первый бар даёт нулевые прирост и убыль
+        delta = 0.0 if self.last is None else price - self.last
+        self.last = price
+        self.avg_gain.update(delta if delta > 0 else 0.0)
+        self.avg_loss.update(-delta if delta < 0 else 0.0)
+        return self.value
+
+    @property
+    def value(self):
+        gain, loss = self.avg_gain.value, self.avg_loss.value + self.eps
+        if loss == 0:
+            return 100.0 if gain > 0 else math.nan
+        return 100 - (100 / (1 + gain / loss))
+
+
+class EMA:
+    def __init__(self, span):
+        self.alpha = 2 / (span + 1)
+        self.value = math.nan
+
+    def update(self, value):
+        if math.isnan(self.value):
+            self.value = value
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * value
+        return self.value
+
+
+class MACD:
+    def __init__(self, short_window=12, long_window=26, signal_window=9):
+        self.short_ema = EMA(short_window)
+        self.long_ema = EMA(long_window)
+        self.signal_ema = EMA(signal_window)
+
+    def update(self, price):
+        macd = self.short_ema.update(price) - self.long_ema.update(price)
+        return macd, self.signal_ema.update(macd)
+
+    @property
+    def value(self):
+        return self.short_ema.value - self.long_ema.value, self.signal_ema.value
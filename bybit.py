@@ -0,0 +1,287 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+import httpx
+import pandas as pd
+from metrics import BYBIT_QUEUE_DEPTH, BYBIT_RATE, BYBIT_WAIT_SECONDS, request_timings, timed, with_request_timings
+
+
+# Адрес можно подменить, например на локальный mock_bybit.py
+BYBIT_URL = os.environ.get("BYBIT_URL", "https://api.bybit.com")
+KLINE_PATH = "/v5/market/kline"
+
+# Публичный поток свечей, категория spot - как у /history
+BYBIT_WS_URL = os.environ.get("BYBIT_WS_URL", "wss://stream.bybit.com/v5/public/spot")
+
+# Длительность свечи в мс по коду интервала Bybit (месяц - условные 30 дней)
+INTERVAL_MS = {
+    "1": 60_000, "3": 180_000, "5": 300_000, "15": 900_000, "30": 1_800_000,
+    "60": 3_600_000, "120": 7_200_000, "240": 14_400_000, "360": 21_600_000, "720": 43_200_000,
+    "D": 86_400_000, "W": 604_800_000, "M": 2_592_000_000
+}
+
+KLINE_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume", "turnover"]
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# retCode Bybit "Too many visits!" приходит с HTTP 200
+RETRY_CODES = {10006}
+
+# Бюджет запросов в секунду (у Bybit 600 запросов за 5 с на IP) и сколько окон диапазона качается параллельно
+RATE_LIMIT = float(os.environ.get("BYBIT_RATE_LIMIT", "50"))
+FETCH_CONCURRENCY = int(os.environ.get("BYBIT_FETCH_CONCURRENCY", "8"))
+# Свечей в одном запросе при загрузке диапазона
+PAGE_LIMIT = 200
+
+# Классы приоритета: запросы графиков (/history) обслуживаются раньше загрузки истории для бэктестов
+INTERACTIVE, BULK = "interactive", "bulk"
+PRIORITIES = {INTERACTIVE: 0, BULK: 1}
+
+
+@timed("parse_klines")
+def parse_klines(rows):
+    # Bybit отдаёт свечи от новых к старым
+    df = pd.DataFrame(list(reversed(rows)), columns=KLINE_COLUMNS)
+    df["timestamp"] = pd.to_datetime(df["timestamp"].astype(float), unit="ms")
+    df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].astype(float)
+    return df[["timestamp", "open", "high", "low", "close", "volume"]]
+
+
+class RateLimiter:
+    """Адаптивный token bucket с очередью по приоритетам.
+
+    Скорость растёт на increase после каждого удачного ответа (до rate) и падает вдвое
+    при ответе "Too many visits!" (HTTP 429 или retCode 10006), после которого новые
+    запросы ждут cooldown секунд. Токены выдаются сначала INTERACTIVE, затем BULK,
+    внутри класса - по очереди. Работает в одном event loop.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=None, min_rate=1.0, increase=0.5, cooldown=1.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.cooldown = cooldown
+        self.capacity = burst or max(1.0, rate / 5)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled_count = 0
+        self.waiters = []
+        self.depth = dict.fromkeys(PRIORITIES, 0)
+        self.order = itertools.count()
+        self.dispatcher = None
+        BYBIT_RATE.set(self.rate)
+
+    async def acquire(self, priority=BULK):
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (PRIORITIES[priority], next(self.order), future, priority))
+        self._queued(priority, 1)
+        if self.dispatcher is None:
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            await future
+        finally:
+            if not future.done() or future.cancelled():
+                # Отменённый ожидающий остаётся в куче, диспетчер его пропустит
+                future.cancel()
+                self._queued(priority, -1)
+        BYBIT_WAIT_SECONDS.observe(time.monotonic() - started, priority=priority)
+
+    def _queued(self, priority, delta):
+        self.depth[priority] += delta
+        BYBIT_QUEUE_DEPTH.set(self.depth[priority], priority=priority)
+
+    async def _dispatch(self):
+        try:
+            while self.waiters:
+                _, _, future, priority = self.waiters[0]
+                if future.done():
+                    heapq.heappop(self.waiters)
+                    continue
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    heapq.heappop(self.waiters)
+                    self._queued(priority, -1)
+                    future.set_result(None)
+                    continue
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        finally:
+            self.dispatcher = None
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        BYBIT_RATE.set(self.rate)
+
+    def throttled(self):
+        self.throttled_count += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        self.paused_until = time.monotonic() + self.cooldown
+        BYBIT_RATE.set(self.rate)
+
+    def status(self):
+        return {"rate": self.rate, "max_rate": self.max_rate, "throttled": self.throttled_count, "queued": dict(self.depth)}
+
+
+class BybitClient:
+    """Асинхронный клиент публичного API Bybit с общим keep-alive пулом соединений.
+
+    Все запросы проходят через RateLimiter. Ответы о превышении лимита повторяются
+    после паузы лимитера (не больше max_throttled раз), прочие сбои - retries раз
+    с экспоненциальной задержкой.
+    """
+
+    def __init__(self, base_url=BYBIT_URL, timeout=10.0, retries=3, backoff=0.5, max_connections=100,
+                 limiter=None, max_throttled=20):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_throttled = max_throttled
+        self.limiter = limiter or RateLimiter()
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=20)
+        )
+
+    async def get(self, path, params, priority=INTERACTIVE, request_timing=True):
+        attempt = throttled = 0
+        while True:
+            await self.limiter.acquire(priority)
+            limited = False
+            try:
+                with timed("bybit_request", request_timing):
+                    response = await self.client.get(path, params=params)
+                if response.status_code == 200:
+                    payload = response.json()
+                    if payload.get("retCode") not in RETRY_CODES:
+                        self.limiter.succeeded()
+                        return payload
+                    limited = True
+                elif response.status_code == 429:
+                    limited = True
+                elif response.status_code not in RETRY_STATUSES:
+                    raise Exception(f"Bybit API error: {response.status_code} {response.text}")
+                error = Exception(f"Bybit API error: {response.status_code} {response.text}")
+            except httpx.TransportError as e:
+                error = e
+
+            if limited:
+                self.limiter.throttled()
+                throttled += 1
+                if throttled > self.max_throttled:
+                    raise error
+            else:
+                if attempt >= self.retries:
+                    raise error
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+    async def get_kline(self, symbol, interval, category="linear", limit=200, start=None, end=None, priority=INTERACTIVE,
+                        request_timing=True):
+        params = {"category": category, "symbol": symbol, "interval": interval, "limit": limit}
+        if start is not None:
+            params["start"] = start
+        if end is not None:
+            params["end"] = end
+        return await self.get(KLINE_PATH, params, priority, request_timing)
+
+    async def get_klines(self, symbol, interval, start_ts, end_ts, category="linear", concurrency=FETCH_CONCURRENCY,
+                         priority=BULK):
+        # Диапазон делится на независимые окна по PAGE_LIMIT свечей с явными start/end,
+        # окна качаются параллельно, результат склеивается и очищается от дублей.
+        # В Server-Timing попадает вся загрузка (bybit_klines), отдельные запросы - только в гистограмму
+        step = INTERVAL_MS[interval]
+        end_ts = min(end_ts, int(time.time() * 1000))
+        windows = [(start, min(start + PAGE_LIMIT * step - 1, end_ts)) for start in range(start_ts, end_ts + 1, PAGE_LIMIT * step)]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(start, end):
+            async with semaphore:
+                result = await self.get_kline(symbol, interval, category=category, limit=PAGE_LIMIT, start=start, end=end,
+                                              priority=priority, request_timing=False)
+            if result.get("retCode") != 0:
+                raise Exception(f"Bybit API error: {result.get('retCode')} {result.get('retMsg')}")
+            rows = result.get("result", {}).get("list", [])
+            return parse_klines(rows) if rows else None
+
+        with timed("bybit_klines"):
+            frames = [df for df in await asyncio.gather(*(fetch(start, end) for start, end in windows)) if df is not None]
+        if not frames:
+            return pd.DataFrame(columns=KLINE_COLUMNS[:6])
+        data = pd.concat(frames).drop_duplicates("timestamp", keep="last").sort_values("timestamp")
+        return data.reset_index(drop=True)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class MarketClient:
+    """Общий на процесс клиент публичного API Bybit.
+
+    BybitClient живёт в собственном потоке с event loop, поэтому один пул соединений
+    и один RateLimiter делят и API (свой loop uvicorn), и синхронный код
+    (ExchangeSimulator.load_data, потоки PortfolioBacktest).
+    """
+
+    def __init__(self, base_url=BYBIT_URL, rate=RATE_LIMIT):
+        self.pid = os.getpid()
+        self.closed = False
+        self.client = BybitClient(base_url=base_url, limiter=RateLimiter(rate))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="bybit-client", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(with_request_timings(request_timings(), coro), self.loop)
+
+    async def get_kline(self, symbol, interval, priority=INTERACTIVE, **kwargs):
+        return await asyncio.wrap_future(self.submit(self.client.get_kline(symbol, interval, priority=priority, **kwargs)))
+
+    async def get_klines(self, symbol, interval, start_ts, end_ts, priority=BULK, **kwargs):
+        return await asyncio.wrap_future(
+            self.submit(self.client.get_klines(symbol, interval, start_ts, end_ts, priority=priority, **kwargs))
+        )
+
+    def get_klines_sync(self, symbol, interval, start_ts, end_ts, priority=BULK, **kwargs):
+        return self.submit(self.client.get_klines(symbol, interval, start_ts, end_ts, priority=priority, **kwargs)).result()
+
+    def status(self):
+        return self.client.limiter.status()
+
+    def close(self, timeout=5.0):
+        # Закрывает пул соединений в его loop, останавливает loop и дожидается потока
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result(timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+            if not self.thread.is_alive():
+                self.loop.close()
+
+
+_market_client = None
+_market_client_lock = threading.Lock()
+
+
+def market_client():
+    # После fork поток с loop в дочерний процесс не переходит, там создаётся свой клиент;
+    # после close (остановка API) следующий вызов тоже создаёт новый
+    global _market_client
+    with _market_client_lock:
+        if _market_client is None or _market_client.pid != os.getpid() or _market_client.closed:
+            _market_client = MarketClient()
+        return _market_client
@@ -0,0 +1,194 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from bybit import BYBIT_URL
+
+
+BYBIT_DEMO_URL = "https://api-demo.bybit.com"
+RECV_WINDOW = "10000"
+ORDER_PATH = "/v5/order/create"
+ORDER_REALTIME_PATH = "/v5/order/realtime"
+INSTRUMENTS_PATH = "/v5/market/instruments-info"
+ORDER_HISTORY_PATH = "/v5/order/history"
+WALLET_BALANCE_PATH = "/v5/account/wallet-balance"
+
+ACCOUNT_TYPES = ["UNIFIED", "CONTRACT", "SPOT", "FUNDING"]
+
+
+class Signer:
+    """Подпись запросов приватного API Bybit (HMAC-SHA256).
+
+    Ключ HMAC разворачивается один раз в конструкторе, на каждый запрос
+    копируется готовое состояние и дописывается только строка запроса.
+    """
+
+    def __init__(self, api_key, api_secret, recv_window=RECV_WINDOW):
+        self.api_key = api_key
+        self.recv_window = recv_window
+        self.mac = hmac.new(api_secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self.middle = f"{api_key}{recv_window}".encode("utf-8")
+        self.static_headers = {
+            "X-BAPI-API-KEY": api_key,
+            "X-BAPI-RECV-WINDOW": recv_window,
+            "Content-Type": "application/json"
+        }
+
+    def sign(self, timestamp, payload):
+        # Bybit подписывает timestamp + api_key + recv_window + (query string или JSON-тело)
+        mac = self.mac.copy()
+        mac.update(timestamp.encode("utf-8"))
+        mac.update(self.middle)
+        mac.update(payload.encode("utf-8"))
+        return mac.hexdigest()
+
+    def headers(self, payload):
+        timestamp = str(int(time.time() * 1000))
+        return {**self.static_headers, "X-BAPI-TIMESTAMP": timestamp, "X-BAPI-SIGN": self.sign(timestamp, payload)}
+
+
+def query_string(params):
+    return urllib.parse.urlencode(sorted(params.items()))
+
+
+def body_json(body):
+    # Тело сериализуется один раз: подписывается и отправляется одна и та же строка
+    return json.dumps(body, separators=(",", ":"), sort_keys=True)
+
+
+class BybitPrivateClient:
+    """Асинхронный клиент приватного API Bybit с постоянным keep-alive соединением."""
+
+    def __init__(self, api_key, api_secret, base_url=BYBIT_URL, timeout=10.0):
+        self.signer = Signer(api_key, api_secret)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10, keepalive_expiry=300)
+        )
+
+    async def warmup(self):
+        # Соединение (TCP + TLS) устанавливается заранее, а не на первом ордере
+        await self.client.get("/v5/market/time")
+
+    async def get(self, path, params):
+        query = query_string(params)
+        response = await self.client.get(f"{path}?{query}", headers=self.signer.headers(query))
+        return self._result(response)
+
+    async def post(self, path, body):
+        payload = body_json(body)
+        response = await self.client.post(path, content=payload, headers=self.signer.headers(payload))
+        return self._result(response)
+
+    def _result(self, response):
+        if response.status_code != 200:
+            raise Exception(f"Bybit API error: {response.status_code} {response.text}")
+        data = response.json()
+        if data.get("retCode") != 0:
+            raise Exception(f"Bybit API error: {data.get('retCode')} {data.get('retMsg')}")
+        return data.get("result", {})
+
+    async def create_order(self, symbol, side, qty, category="spot", order_type="Market", **extra):
+        body = {"category": category, "symbol": symbol, "side": side, "orderType": order_type, "qty": str(qty), **extra}
+        return await self.post(ORDER_PATH, body)
+
+    async def get_order(self, order_id, category="spot"):
+        # Исполнение ордера: cumExecQty, cumExecValue, cumExecFee, avgPrice
+        result = await self.get(ORDER_REALTIME_PATH, {"category": category, "orderId": order_id})
+        if not result.get("list"):
+            raise Exception(f"Bybit API error: order {order_id} not found")
+        return result["list"][0]
+
+    async def get_instrument(self, symbol, category="spot"):
+        result = await self.get(INSTRUMENTS_PATH, {"category": category, "symbol": symbol})
+        if not result.get("list"):
+            raise Exception(f"Bybit API error: instrument {symbol} not found")
+        return result["list"][0]
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class BybitPrivateSession:
+    """Синхронный клиент приватного API Bybit для app.py.
+
+    Один keep-alive пул на все запросы, балансы по типам счетов запрашиваются
+    параллельно и кэшируются на balance_ttl секунд.
+    """
+
+    def __init__(self, api_key, api_secret, base_url=BYBIT_URL, timeout=10.0, balance_ttl=10.0):
+        self.signer = Signer(api_key, api_secret)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=len(ACCOUNT_TYPES)))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=len(ACCOUNT_TYPES)))
+        self.executor = ThreadPoolExecutor(max_workers=len(ACCOUNT_TYPES), thread_name_prefix="bybit-private")
+        self.balance_ttl = balance_ttl
+        self.balances = None
+        self.balances_expire = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, path, params):
+        query = query_string(params)
+        return self.session.get(f"{self.base_url}{path}?{query}", headers=self.signer.headers(query), timeout=self.timeout)
+
+    def post(self, path, body):
+        payload = body_json(body)
+        return self.session.post(f"{self.base_url}{path}", data=payload, headers=self.signer.headers(payload), timeout=self.timeout)
+
+    def get_wallet_balance(self, account_type):
+        # Список монет счёта, [] если счёта нет, строка с ошибкой при сбое HTTP
+        try:
+            response = self.get(WALLET_BALANCE_PATH, {"accountType": account_type})
+        except requests.RequestException as e:
+            return f"Ошибка {e}"
+        if response.status_code != 200:
+            return f"Ошибка {response.status_code}"
+        data = response.json()
+        if data["retCode"] == 0 and data["result"]["list"]:
+            return data["result"]["list"][0]["coin"]
+        return []
+
+    def get_wallet_balance_all_accounts(self):
+        with self.lock:
+            if self.balances is not None and time.monotonic() < self.balances_expire:
+                return self.balances
+            balances = dict(zip(ACCOUNT_TYPES, self.executor.map(self.get_wallet_balance, ACCOUNT_TYPES)))
+            self.balances = balances
+            self.balances_expire = time.monotonic() + self.balance_ttl
+            return balances
+
+    def get_order_history(self, symbol=None, category="linear", limit=50):
+        params = {"category": category, "limit": limit}
+        if symbol:
+            params["symbol"] = symbol
+
+        response = self.get(ORDER_HISTORY_PATH, params)
+        if response.status_code != 200:
+            return None, f"HTTP ошибка: {response.status_code}"
+
+        data = response.json()
+        if data.get("retCode") != 0:
+            return None, data.get("retMsg", "Неизвестная ошибка")
+
+        return data.get("result", {}).get("list", []), None
+
+    def create_order(self, symbol, side, qty, category="linear", order_type="Market", **extra):
+        # Возвращает ответ Bybit целиком: retCode проверяет вызывающий
+        body = {"category": category, "symbol": symbol, "side": side, "orderType": order_type, "qty": str(qty), **extra}
+        response = self.post(ORDER_PATH, body)
+        # После ордера балансы меняются, кэш сбрасывается
+        self.balances = None
+        return response.json()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,125 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from pydantic import BaseModel
+
+
+MISSING = object()
+
+
+def estimate_size(value):
+    # Приблизительный размер объекта в байтах с учётом вложенных элементов
+    if isinstance(value, BaseModel):
+        value = value.__dict__
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class MemoryBackend:
+    """LRU-хранилище в памяти процесса, ограниченное суммарным размером значений."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            self.expirations += 1
+            return MISSING
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        self.delete(key)
+        self.entries[key] = (time.monotonic() + ttl, size, value)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.delete(oldest)
+            self.evictions += 1
+
+    def delete(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class ResponseCache:
+    """TTL-кэш с объединением одинаковых одновременных промахов (single-flight).
+
+    Хранилище подключаемое: любой объект с методами get/set/delete/stats,
+    как у MemoryBackend.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key, ttl, loader):
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Исключение забирается здесь, чтобы не было предупреждения, если ждущих нет
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.inflight[key] = future
+        try:
+            value = await loader()
+            self.backend.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self.inflight[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self.inflight),
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            **self.backend.stats()
+        }
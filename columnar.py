@@ -0,0 +1,31 @@
+import json
+import numpy as np
+import pyarrow as pa
+
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def accepts_arrow(request):
+    return ARROW_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def to_arrow(columns, metadata=None):
+    # Колонки - NumPy-массивы одинаковой длины; метаданные кладутся в схему как JSON
+    table = pa.table({name: pa.array(values) for name, values in columns.items()})
+    table = table.replace_schema_metadata({key: json.dumps(value) for key, value in (metadata or {}).items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_arrow(payload):
+    table = pa.ipc.open_stream(payload).read_all()
+    columns = {name: table.column(name).to_numpy() for name in table.column_names}
+    metadata = {key.decode(): json.loads(value) for key, value in (table.schema.metadata or {}).items()}
+    return columns, metadata
+
+
+def epoch_ms(values):
+    return np.asarray(values, dtype="datetime64[ms]").view(np.int64)
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+def minmax_indices(values, max_points):
+    """Индексы точек для отрисовки: минимум и максимум в каждой корзине плюс края ряда.
+
+    Форма ряда (пики и провалы) сохраняется, а точек остаётся не больше max_points.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+
+    buckets = max(1, (max_points - 2) // 2)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+
+    nan = np.isnan(padded)
+    offsets = np.arange(buckets) * size
+    lows = np.argmin(np.where(nan, np.inf, padded), axis=1) + offsets
+    highs = np.argmax(np.where(nan, -np.inf, padded), axis=1) + offsets
+
+    indices = np.unique(np.concatenate(([0, n - 1], lows, highs)))
+    return indices[indices < n]
+
+
+def window_indices(timestamps, start=None, end=None):
+    # Границы окна [start, end] в тех же единицах, что и timestamps (epoch ms)
+    lo = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+    hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side="right")
+    return lo, hi
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import time
+import numpy as np
+from websockets.asyncio.client import connect
+from bybit import BYBIT_WS_URL, INTERVAL_MS
+
+
+# Bybit принимает не больше 10 топиков в одном запросе subscribe и рвёт соединение без ping 20 с
+SUBSCRIBE_BATCH = 10
+PING_INTERVAL = 20
+MAX_BACKOFF = 30.0
+# Больше Bybit не отдаёт одним REST-запросом
+BACKFILL_LIMIT = 1000
+
+
+class CandleRing:
+    """Кольцевой буфер последних свечей одного символа и интервала.
+
+    Хранит метки времени (epoch ms, int64) и open/high/low/close/volume/turnover (float64).
+    """
+
+    def __init__(self, capacity, step):
+        self.capacity = capacity
+        self.step = step
+        self.timestamp = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, 6), dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        # Растёт при каждом изменении, годится как часть ключа кэша
+        self.version = 0
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamp[self.head - 1]) if self.count else None
+
+    def update(self, ts, values):
+        # Возвращает True, если между последней и новой свечой пропуск
+        last = self.last_timestamp
+        gap = False
+        if last is None or ts > last:
+            gap = last is not None and ts > last + self.step
+            self.timestamp[self.head] = ts
+            self.values[self.head] = values
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        elif ts == last:
+            self.values[self.head - 1] = values
+        else:
+            # Поправка к одной из прошлых свечей
+            slots = np.flatnonzero(self.timestamp[:self.count] == ts)
+            if not len(slots):
+                return False
+            self.values[slots[0]] = values
+        self.version += 1
+        return gap
+
+    def extend(self, rows, prefer_new=False):
+        # Слияние с REST-выгрузкой: rows в формате Bybit. По умолчанию свежие данные потока важнее,
+        # prefer_new=True - строки REST заменяют свечи буфера с теми же метками
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, 7)
+        order = self.ordered()
+        timestamp = (rows[:, 0].astype(np.int64), self.timestamp[order])
+        values = (rows[:, 1:], self.values[order])
+        if prefer_new:
+            timestamp, values = timestamp[::-1], values[::-1]
+        timestamp, values = np.concatenate(timestamp), np.concatenate(values)
+        # Остаётся последнее вхождение метки: из буфера или, при prefer_new, из rows
+        _, last = np.unique(timestamp[::-1], return_index=True)
+        keep = len(timestamp) - 1 - last
+        keep = keep[np.argsort(timestamp[keep])][-self.capacity:]
+
+        self.count = len(keep)
+        self.timestamp[:self.count] = timestamp[keep]
+        self.values[:self.count] = values[keep]
+        self.head = self.count % self.capacity
+        self.version += 1
+
+    def ordered(self):
+        # Индексы слотов от старых к новым
+        return (self.head - self.count + np.arange(self.count)) % self.capacity
+
+    def latest(self, limit):
+        # Последние limit свечей в формате REST Bybit: от новых к старым
+        order = self.ordered()[::-1][:limit]
+        return np.column_stack((self.timestamp[order], self.values[order])).tolist()
+
+
+class KlineIngestor:
+    """Фоновая подписка на поток kline Bybit с буферами CandleRing.
+
+    После каждого (пере)подключения буферы добираются через REST, пропуски
+    внутри потока тоже закрываются REST-запросом.
+    """
+
+    def __init__(self, client, tickers, intervals, capacity=1000, url=BYBIT_WS_URL, category="spot"):
+        self.client = client
+        self.url = url
+        self.category = category
+        self.rings = {
+            (symbol, interval): CandleRing(capacity, INTERVAL_MS[interval])
+            for symbol in tickers for interval in intervals
+        }
+        self.live = False
+        self.task = None
+        self.backfills = set()
+        self.listeners = {}
+        self.stats = {"messages": 0, "reconnects": 0, "backfills": 0, "gaps": 0}
+
+    def subscribe(self, symbol, interval):
+        # Очередь закрытых свечей: (начало свечи в epoch ms, время сообщения по часам биржи в ms,
+        # time.perf_counter() на приёме)
+        queue = asyncio.Queue()
+        self.listeners.setdefault((symbol, interval), []).append(queue)
+        return queue
+
+    def ring(self, symbol, interval, limit):
+        # Буфер годится, только если поток жив и в нём хватает свечей
+        ring = self.rings.get((symbol, interval))
+        if ring is None or not self.live or ring.count < limit:
+            return None
+        return ring
+
+    async def start(self):
+        if self.rings:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, *self.backfills, return_exceptions=True)
+
+    async def _run(self):
+        topics = [f"kline.{interval}.{symbol}" for symbol, interval in self.rings]
+        backoff = 1.0
+        while True:
+            try:
+                async with connect(self.url, ping_interval=None) as ws:
+                    for i in range(0, len(topics), SUBSCRIBE_BATCH):
+                        await ws.send(json.dumps({"op": "subscribe", "args": topics[i:i + SUBSCRIBE_BATCH]}))
+                    # Подписка раньше выгрузки: свечи, пришедшие во время REST-запросов, не теряются
+                    await asyncio.gather(*(self._backfill(symbol, interval) for symbol, interval in self.rings))
+                    self.live = True
+                    backoff = 1.0
+                    pinger = asyncio.create_task(self._ping(ws))
+                    try:
+                        async for message in ws:
+                            self._handle(json.loads(message))
+                    finally:
+                        pinger.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Kline stream error: {e}")
+            self.live = False
+            self.stats["reconnects"] += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await ws.send(json.dumps({"op": "ping"}))
+
+    def _handle(self, message):
+        topic = message.get("topic", "")
+        if not topic.startswith("kline."):
+            return
+        _, interval, symbol = topic.split(".", 2)
+        ring = self.rings.get((symbol, interval))
+        if ring is None:
+            return
+
+        self.stats["messages"] += 1
+        received = time.perf_counter()
+        for candle in message.get("data", []):
+            start = int(candle["start"])
+            values = [float(candle[k]) for k in ("open", "high", "low", "close", "volume", "turnover")]
+            gap = ring.update(start, values)
+            if candle.get("confirm"):
+                for queue in self.listeners.get((symbol, interval), []):
+                    queue.put_nowait((start, int(message.get("ts", 0)), received))
+            if gap:
+                self.stats["gaps"] += 1
+                task = asyncio.create_task(self._fill_gap(symbol, interval))
+                self.backfills.add(task)
+                task.add_done_callback(self.backfills.discard)
+
+    async def _fill_gap(self, symbol, interval):
+        try:
+            await self._backfill(symbol, interval)
+        except Exception as e:
+            print(f"Kline backfill error {symbol} {interval}: {e}")
+
+    async def _backfill(self, symbol, interval):
+        ring = self.rings[(symbol, interval)]
+        result = await self.client.get_kline(
+            symbol, interval, category=self.category, limit=min(ring.capacity, BACKFILL_LIMIT)
+        )
+        if result.get("retCode") != 0:
+            raise Exception(f"Bybit API error: {result.get('retCode')} {result.get('retMsg')}")
+        ring.extend(result["result"]["list"])
+        self.stats["backfills"] += 1
+
+    def status(self):
+        return {
+            "live": self.live,
+            **self.stats,
+            "rings": {
+                f"{symbol}:{interval}": {"count": ring.count, "last": ring.last_timestamp, "version": ring.version}
+                for (symbol, interval), ring in self.rings.items()
+            }
+        }
@@ -0,0 +1,103 @@
+import asyncio
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # Симулятор нужен только пока задача идёт; после завершения остаются total и processed
+        self.exchange = None
+        self.total = None
+        self.processed = 0
+        self.result = None
+        self.error = None
+
+    def progress(self):
+        exchange = self.exchange
+        if self.total is None and exchange is not None and exchange.data is not None:
+            self.total = len(exchange.timestamp) - 1
+        total = self.total
+        if total is None:
+            return {"processed": 0, "total": None, "eta_seconds": None}
+
+        if exchange is not None:
+            self.processed = min(exchange.current_idx, total)
+        processed = total if self.status == "done" else self.processed
+        eta = None
+        if self.status == "running" and processed > 0:
+            elapsed = time.time() - self.started
+            eta = elapsed / processed * (total - processed)
+        elif self.status == "done":
+            eta = 0.0
+        return {"processed": processed, "total": total, "eta_seconds": eta}
+
+
+class JobManager:
+    """Очередь фоновых бэктестов с ограниченным параллелизмом.
+
+    Одинаковые задачи (по ключу), которые ещё в очереди или выполняются,
+    не запускаются повторно: возвращается уже существующая.
+    """
+
+    def __init__(self, max_workers=2, retention=3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backtest")
+        self.slots = asyncio.Semaphore(max_workers)
+        self.retention = retention
+        self.jobs = {}
+        self.active = {}
+        self.tasks = set()
+
+    def submit(self, key, work):
+        self.purge()
+        job_id = self.active.get(key)
+        if job_id is not None:
+            return self.jobs[job_id]
+
+        job = Job(key)
+        self.jobs[job.id] = job
+        self.active[key] = job.id
+        task = asyncio.create_task(self._execute(job, work))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    async def _execute(self, job, work):
+        try:
+            async with self.slots:
+                job.status = "running"
+                job.started = time.time()
+                job.result = await work(job)
+                job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.progress()
+            job.exchange = None
+            job.finished = time.time()
+            self.active.pop(job.key, None)
+
+    async def run_in_worker(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def purge(self):
+        deadline = time.time() - self.retention
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < deadline]:
+            del self.jobs[job_id]
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import json
+import time
+from decimal import ROUND_DOWN, Decimal
+import numpy as np
+from bots import BOTS
+from bybit import BYBIT_URL, BYBIT_WS_URL, INTERVAL_MS, BybitClient
+from bybit_private import BYBIT_DEMO_URL, BybitPrivateClient
+from ingest import KlineIngestor
+from metrics import LIVE_ORDER_SECONDS
+
+
+MOCK_URL = "http://127.0.0.1:8001"
+
+
+def round_step(value, step):
+    # Вниз до шага лота; строка без экспоненты, как её ждёт Bybit
+    step = Decimal(step)
+    return format((Decimal(repr(float(value))) / step).to_integral_value(ROUND_DOWN) * step, "f")
+
+
+class LiveExchange:
+    """Замена ExchangeSimulator для бота в реальном времени.
+
+    Массивы close/volume/timestamp те же, что у симулятора, current_idx указывает на
+    формирующуюся свечу, поэтому бот видит только закрытые свечи. buy/sell меняют
+    позицию сразу по оценке, ордера копятся в pending и отправляются раннером после тика,
+    а apply_fill заменяет оценку фактическим исполнением.
+    """
+
+    def __init__(self, symbol, stake, fee=0.001, capacity=10000, base_step="0.000001", quote_step="0.01"):
+        self.symbol = symbol
+        self.balance = stake
+        self.position = 0
+        self.entry_price = 0
+        self.fee = fee
+        self.base_step = base_step
+        self.quote_step = quote_step
+        self.timestamp = np.zeros(capacity, dtype=np.int64)
+        self.open = np.zeros(capacity, dtype=np.float64)
+        self.high = np.zeros(capacity, dtype=np.float64)
+        self.low = np.zeros(capacity, dtype=np.float64)
+        self.close = np.zeros(capacity, dtype=np.float64)
+        self.volume = np.zeros(capacity, dtype=np.float64)
+        self.current_idx = 0
+        self.pending = []
+
+    @property
+    def last_timestamp(self):
+        return int(self.timestamp[self.current_idx - 1]) if self.current_idx else None
+
+    def append(self, rows):
+        # rows - свечи от старых к новым: [timestamp, open, high, low, close, volume, ...]
+        for row in rows:
+            if self.current_idx == len(self.close):
+                # Буфер полон: старшая половина сдвигается в начало. current_idx уменьшается,
+                # и StreamingBot.catch_up пересчитывает индикаторы заново
+                half = len(self.close) // 2
+                for array in (self.timestamp, self.open, self.high, self.low, self.close, self.volume):
+                    array[:half] = array[half:].copy()
+                self.current_idx = half
+            i = self.current_idx
+            self.timestamp[i] = int(row[0])
+            self.open[i], self.high[i], self.low[i], self.close[i], self.volume[i] = row[1:6]
+            self.current_idx += 1
+
+    def get_current_price(self):
+        return self.close[self.current_idx - 1]
+
+    def set_precision(self, lot_size_filter):
+        # lotSizeFilter из /v5/market/instruments-info: spot - basePrecision, деривативы - qtyStep
+        self.base_step = lot_size_filter.get("basePrecision") or lot_size_filter.get("qtyStep") or self.base_step
+        self.quote_step = lot_size_filter.get("quotePrecision") or self.quote_step
+
+    def buy(self):
+        if self.position == 0:
+            price = self.get_current_price()
+            amount = round_step(self.balance, self.quote_step)
+            if float(amount) <= 0:
+                return
+            # Рыночная покупка на spot задаётся суммой в валюте котировки
+            self.pending.append(("Buy", amount, {"marketUnit": "quoteCoin"}, float(amount)))
+            self.position = float(amount) * (1 - self.fee) / price
+            self.balance -= float(amount)
+            self.entry_price = price
+
+    def sell(self):
+        if self.position > 0:
+            price = self.get_current_price()
+            qty = round_step(self.position, self.base_step)
+            if float(qty) <= 0:
+                return
+            proceeds = float(qty) * price * (1 - self.fee)
+            # Остаток меньше шага лота продать нельзя, он остаётся на счёте
+            self.pending.append(("Sell", qty, {}, proceeds))
+            self.balance += proceeds
+            self.position = 0
+            self.entry_price = 0
+
+    def apply_fill(self, side, estimate, order):
+        # Фактическое исполнение вместо оценки. На spot комиссия берётся в получаемой монете:
+        # при покупке - в базовой, при продаже - в валюте котировки
+        qty, value, fee = float(order["cumExecQty"]), float(order["cumExecValue"]), float(order["cumExecFee"])
+        if qty <= 0:
+            raise Exception(f"order {order.get('orderId')} not filled yet: {order.get('orderStatus')}")
+        if side == "Buy":
+            self.balance += estimate - value
+            self.position = qty - fee
+            self.entry_price = value / qty
+        else:
+            self.balance += value - fee - estimate
+
+    def get_equity(self):
+        if self.position > 0:
+            return self.balance + self.position * self.get_current_price()
+        return self.balance
+
+    def snapshot(self):
+        return self.balance, self.position, self.entry_price
+
+    def restore(self, state):
+        self.balance, self.position, self.entry_price = state
+
+
+class LiveRunner:
+    """Подаёт закрытые свечи из потока kline в бота и отправляет его ордера.
+
+    Задержки пишутся в LIVE_ORDER_SECONDS по стадиям: close_to_ack - от конца свечи
+    до подтверждения ордера (доставка по часам биржи плюс локальное время до ответа),
+    receive_to_ack - от получения закрытия свечи до подтверждения, decision - время тика бота.
+    """
+
+    def __init__(self, bot, symbol, interval, private, market, stake=100.0, category="spot",
+                 bot_params=None, ws_url=BYBIT_WS_URL, history=1000):
+        self.symbol = symbol
+        self.interval = interval
+        self.category = category
+        self.private = private
+        self.exchange = LiveExchange(symbol, stake)
+        self.bot = BOTS[bot](self.exchange, **(bot_params or {}))
+        self.ingestor = KlineIngestor(market, [symbol], [interval], capacity=history, url=ws_url, category=category)
+        self.latencies = {"close_to_ack": [], "receive_to_ack": [], "decision": []}
+        self.orders = []
+
+    async def run(self, max_candles=None):
+        queue = self.ingestor.subscribe(self.symbol, self.interval)
+        await self.private.warmup()
+        instrument = await self.private.get_instrument(self.symbol, self.category)
+        self.exchange.set_precision(instrument.get("lotSizeFilter", {}))
+        await self.ingestor.start()
+        try:
+            seen = 0
+            while max_candles is None or seen < max_candles:
+                start, sent, received = await queue.get()
+                await self.on_close(start, sent, received)
+                seen += 1
+        finally:
+            await self.ingestor.stop()
+
+    async def on_close(self, start, sent, received):
+        ring = self.ingestor.rings[(self.symbol, self.interval)]
+        last = self.exchange.last_timestamp
+        # Из буфера берутся все закрытые свечи после уже известных, в том числе пропущенные при переподключении
+        rows = [row for row in reversed(ring.latest(ring.count)) if row[0] <= start and (last is None or row[0] > last)]
+        self.exchange.append(rows)
+
+        state = self.exchange.snapshot()
+        tick_started = time.perf_counter()
+        self.bot.tick()
+        self.record("decision", time.perf_counter() - tick_started)
+
+        pending, self.exchange.pending = self.exchange.pending, []
+        for side, qty, extra, estimate in pending:
+            try:
+                result = await self.private.create_order(self.symbol, side, qty, category=self.category, **extra)
+            except Exception as e:
+                print(f"Order {side} {qty} {self.symbol} failed: {e}")
+                self.exchange.restore(state)
+                continue
+            local = time.perf_counter() - received
+            self.record("receive_to_ack", local)
+            self.record("close_to_ack", (sent - start - INTERVAL_MS[self.interval]) / 1000 + local)
+            order_id = result.get("orderId")
+            filled = None
+            try:
+                order = await self.private.get_order(order_id, self.category)
+                self.exchange.apply_fill(side, estimate, order)
+                filled = order["cumExecQty"]
+            except Exception as e:
+                print(f"Order {order_id} fill unknown, position is estimated: {e}")
+            self.orders.append({"time": start, "side": side, "qty": qty, "filled": filled, "order_id": order_id})
+
+    def record(self, stage, seconds):
+        self.latencies[stage].append(seconds)
+        LIVE_ORDER_SECONDS.observe(seconds, stage=stage)
+
+    def summary(self):
+        rows = {}
+        for stage, values in self.latencies.items():
+            if values:
+                p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+                rows[stage] = {"count": len(values), "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "max_ms": max(values) * 1000}
+        return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Живой запуск бота из bots.py на закрытых свечах Bybit")
+    parser.add_argument("--bot", default="SimpleBot", choices=list(BOTS))
+    parser.add_argument("--params", default="{}", help="параметры бота в JSON")
+    parser.add_argument("--symbol", default="BTCUSDT")
+    parser.add_argument("--interval", default="1", help="интервал Bybit: 1, 5, 60, D ...")
+    parser.add_argument("--stake", type=float, default=100.0, help="сумма покупки в USDT")
+    parser.add_argument("--mode", choices=["paper", "demo", "live"], default="paper",
+                        help="paper - локальный mock_bybit.py, demo - демо-счёт Bybit, live - реальный счёт")
+    parser.add_argument("--mock-url", default=MOCK_URL)
+    parser.add_argument("--candles", type=int, default=None, help="остановиться после N закрытых свечей")
+    args = parser.parse_args(argv)
+
+    if args.mode == "paper":
+        key, secret = "mock-key", "mock-secret"
+        rest_url, private_url = args.mock_url, args.mock_url
+        ws_url = args.mock_url.replace("http", "ws") + "/v5/public/spot"
+    else:
+        with open("config.json", "r") as file:
+            config = json.load(file)
+        prefix = "DEMO_" if args.mode == "demo" else ""
+        key, secret = config.get(f"{prefix}BYBIT_API_KEY"), config.get(f"{prefix}BYBIT_API_SECRET")
+        rest_url, ws_url = BYBIT_URL, BYBIT_WS_URL
+        private_url = BYBIT_DEMO_URL if args.mode == "demo" else BYBIT_URL
+
+    async def run():
+        market = BybitClient(base_url=rest_url)
+        private = BybitPrivateClient(key, secret, base_url=private_url)
+        runner = LiveRunner(args.bot, args.symbol, args.interval, private, market, stake=args.stake,
+                            bot_params=json.loads(args.params), ws_url=ws_url)
+        try:
+            await runner.run(args.candles)
+        finally:
+            await private.aclose()
+            await market.aclose()
+            print(f"orders: {len(runner.orders)}")
+            for stage, row in runner.summary().items():
+                print(f"{stage:<16}" + "  ".join(f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}" for k, v in row.items()))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import httpx
+import numpy as np
+
+
+# Нагрузочный прогон api.py. С --spawn поднимает mock_bybit.py и api.py локально,
+# так что реальный api.bybit.com не затрагивается.
+
+def scenarios(days):
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    return {
+        "history": ("/history", {"interval": "60", "limit": 200}),
+        "history_rsi": ("/history", {"interval": "15", "limit": 500, "show_ema": True, "show_rsi": True}),
+        "backtest": ("/backtest", {
+            "start_date": start.strftime("%Y-%m-%d"), "end_date": end.strftime("%Y-%m-%d"),
+            "timeframe": "1h", "vectorized": True, "max_points": 1000
+        }),
+        "tickers": ("/tickers", {})
+    }
+
+
+async def worker(client, queue, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        name, path, params = next(queue)
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, params=params)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        latencies[name].append(time.perf_counter() - started)
+        if not ok:
+            errors[name] += 1
+
+
+async def run_load(url, names, tickers, concurrency, duration, days):
+    available = scenarios(days)
+    requests = [
+        (name, available[name][0], {**available[name][1], "ticker": ticker} if name != "tickers" else {})
+        for name in names for ticker in tickers
+    ]
+    queue = itertools.cycle(requests)
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60.0, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(worker(client, queue, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def report(latencies, errors, elapsed):
+    print(f"{'endpoint':<14}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, values in latencies.items():
+        if not values:
+            continue
+        p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+        print(
+            f"{name:<14}{len(values):>10}{errors[name]:>8}{len(values) / elapsed:>9.1f}"
+            f"{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}{max(values) * 1000:>9.1f}"
+        )
+    total = sum(len(v) for v in latencies.values())
+    print(f"total: {total} requests in {elapsed:.1f}s, {total / elapsed:.1f} req/s")
+
+
+def wait_ready(url, path, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url + path, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise Exception(f"{url} не поднялся за {timeout} с")
+
+
+def spawn(module, port, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port), "--log-level", "warning"],
+        env=env
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест api.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="адрес api.py (игнорируется с --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="запустить mock_bybit.py и api.py локально")
+    parser.add_argument("--endpoints", default="history,backtest")
+    parser.add_argument("--tickers", default="BTCUSDT,ETHUSDT,SOLUSDT")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность прогона в секундах")
+    parser.add_argument("--days", type=int, default=30, help="глубина истории для /backtest")
+    parser.add_argument("--mock-latency-ms", default="50")
+    parser.add_argument("--mock-rate-limit", default="", help="лимит запросов в секунду у mock_bybit")
+    args = parser.parse_args(argv)
+
+    names = args.endpoints.split(",")
+    tickers = args.tickers.split(",")
+    processes = []
+    url = args.url
+    try:
+        if args.spawn:
+            mock_url, url = "http://127.0.0.1:8001", "http://127.0.0.1:8002"
+            env = {
+                **os.environ,
+                "MOCK_LATENCY_MS": args.mock_latency_ms,
+                "MOCK_RATE_LIMIT": args.mock_rate_limit,
+                "BYBIT_URL": mock_url,
+                "BYBIT_WS_URL": mock_url.replace("http", "ws") + "/v5/public/spot",
+                # Синтетические свечи не должны попасть в настоящее хранилище
+                "CANDLE_STORE_DIR": tempfile.mkdtemp(prefix="loadtest-candles-")
+            }
+            processes.append(spawn("mock_bybit", 8001, env))
+            wait_ready(mock_url, "/mock/stats")
+            processes.append(spawn("api", 8002, env))
+            wait_ready(url, "/tickers")
+
+        latencies, errors, elapsed = asyncio.run(
+            run_load(url, names, tickers, args.concurrency, args.duration, args.days)
+        )
+        report(latencies, errors, elapsed)
+        if args.spawn:
+            print(f"upstream: {httpx.get(mock_url + '/mock/stats').json()}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+
+COINGECKO_URL = "https://api.coingecko.com/api/v3"
+
+
+class Source:
+    def __init__(self, name, url, params=None, ttl=60, timeout=5.0):
+        self.name = name
+        self.url = url
+        self.params = params or {}
+        self.ttl = ttl
+        self.timeout = timeout
+
+
+def overview_sources(cryptopanic_token):
+    # Источники страницы Market Overview; ttl - насколько часто меняются данные
+    return [
+        Source("prices", f"{COINGECKO_URL}/simple/price",
+               {"ids": "bitcoin,ethereum,binancecoin,solana,ripple", "vs_currencies": "usd"}, ttl=30),
+        Source("fear_greed", "https://api.alternative.me/fng/", ttl=600),
+        Source("volumes", f"{COINGECKO_URL}/coins/markets",
+               {"vs_currency": "usd", "ids": "bitcoin,ethereum,solana"}, ttl=120),
+        Source("news", "https://cryptopanic.com/api/v1/posts/",
+               {"auth_token": cryptopanic_token, "currencies": "BTC,ETH,SOL,XRP,BNB", "public": "true"}, ttl=300),
+    ]
+
+
+class MarketData:
+    """Параллельная загрузка внешних источников с TTL-кэшем и stale-while-revalidate.
+
+    Свежие данные отдаются из кэша. Устаревшие (не старше max_stale секунд) тоже
+    отдаются сразу, а обновление идёт в фоне. Ждать приходится только источники,
+    которых нет в кэше, и не дольше их таймаута. Если источник недоступен, остаются
+    последние удачные данные.
+    """
+
+    def __init__(self, sources, max_stale=3600):
+        self.sources = {source.name: source for source in sources}
+        self.max_stale = max_stale
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=len(self.sources)))
+        self.executor = ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix="market-data")
+        self.entries = {}
+        self.errors = {}
+        self.refreshing = {}
+        self.lock = threading.Lock()
+
+    def _fetch(self, source):
+        try:
+            response = self.session.get(source.url, params=source.params, timeout=source.timeout)
+            response.raise_for_status()
+            value = response.json()
+            with self.lock:
+                self.entries[source.name] = (time.monotonic(), value)
+                self.errors.pop(source.name, None)
+        except (requests.RequestException, ValueError) as e:
+            with self.lock:
+                self.errors[source.name] = (time.monotonic(), str(e))
+        finally:
+            with self.lock:
+                self.refreshing.pop(source.name, None)
+
+    def _refresh(self, name):
+        # Вызывается под self.lock; одновременно идёт не больше одного запроса на источник
+        future = self.refreshing.get(name)
+        if future is None:
+            future = self.refreshing[name] = self.executor.submit(self._fetch, self.sources[name])
+        return future
+
+    def get_all(self):
+        # {имя: {"data": ответ или None, "error": текст или None, "age": возраст в секундах или None}}
+        now = time.monotonic()
+        waiting = {}
+        with self.lock:
+            for name, source in self.sources.items():
+                entry = self.entries.get(name)
+                age = now - entry[0] if entry else None
+                if age is None or age >= source.ttl:
+                    future = self._refresh(name)
+                    # Недавно упавший источник без данных не ждём, он обновляется в фоне
+                    failed = self.errors.get(name)
+                    recently_failed = failed is not None and now - failed[0] < source.ttl
+                    if (age is None or age >= self.max_stale) and not recently_failed:
+                        waiting[name] = future
+
+        if waiting:
+            wait(waiting.values(), timeout=max(self.sources[name].timeout for name in waiting))
+
+        now = time.monotonic()
+        results = {}
+        with self.lock:
+            for name in self.sources:
+                entry = self.entries.get(name)
+                error = self.errors.get(name, (None, None))[1]
+                if entry is not None and now - entry[0] < self.max_stale:
+                    results[name] = {"data": entry[1], "error": error, "age": now - entry[0]}
+                else:
+                    results[name] = {"data": None, "error": error or "timeout", "age": None}
+        return results
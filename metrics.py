@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# METRICS_ENABLED=0 отключает замеры целиком
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Стадии текущего HTTP-запроса для заголовка Server-Timing
+_request_timings = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с произвольными метками."""
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [(key, list(counts), total) for key, (counts, total) in sorted(self.series.items())]
+        for key, counts, total in series:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Текущее значение в формате Prometheus с произвольными метками."""
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.series[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            series = sorted(self.series.items())
+        for key, value in series:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("cryptoapp_stage_duration_seconds", "Длительность стадий обработки")
+REQUEST_SECONDS = Histogram("cryptoapp_http_request_duration_seconds", "Длительность HTTP-запросов")
+
+LIVE_ORDER_SECONDS = Histogram("cryptoapp_live_order_latency_seconds", "Задержка живого бота до подтверждения ордера")
+
+BYBIT_WAIT_SECONDS = Histogram("cryptoapp_bybit_queue_wait_seconds", "Ожидание в очереди лимитера запросов к Bybit")
+BYBIT_QUEUE_DEPTH = Gauge("cryptoapp_bybit_queue_depth", "Запросы к Bybit в очереди лимитера")
+BYBIT_RATE = Gauge("cryptoapp_bybit_rate_limit", "Текущий бюджет запросов к Bybit в секунду")
+
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, LIVE_ORDER_SECONDS, BYBIT_WAIT_SECONDS, BYBIT_QUEUE_DEPTH, BYBIT_RATE]
+
+
+def record(stage, seconds, request=True):
+    # request=False - только в гистограмму, без Server-Timing (например, параллельные запросы,
+    # чьи длительности в сумме больше времени ответа)
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get() if request else None
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage, request=True):
+    # Работает и как декоратор синхронной функции: @timed("compute_rsi")
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, request)
+
+
+def request_timings():
+    return _request_timings.get()
+
+
+async def with_request_timings(timings, coro):
+    # Корутина из другого потока/loop пишет стадии в Server-Timing исходного запроса
+    token = _request_timings.set(timings)
+    try:
+        return await coro
+    finally:
+        _request_timings.reset(token)
+
+
+def render():
+    return "\n".join(h.render() for h in REGISTRY) + "\n"
+
+
+def server_timing(timings, total):
+    entries = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware: собирает стадии запроса в Server-Timing и пишет длительность в гистограмму.
+
+    Заголовок уходит вместе с началом ответа, поэтому у потоковых ответов
+    в нём только стадии, завершившиеся до первого байта.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(timings, time.perf_counter() - started)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            # Шаблон маршрута, а не сырой путь, чтобы id в пути не плодили серии;
+            # запросы мимо маршрутов (404, сканеры) идут в одну серию
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=scope["method"], path=route, status=str(status)
+            )
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+import zlib
+from functools import lru_cache
+import numpy as np
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from bybit import INTERVAL_MS, KLINE_PATH
+from bybit_private import INSTRUMENTS_PATH, ORDER_HISTORY_PATH, ORDER_PATH, ORDER_REALTIME_PATH, WALLET_BALANCE_PATH, Signer
+
+
+# Локальная замена публичного kline API Bybit для нагрузочных тестов.
+# Запуск: uvicorn mock_bybit:app --port 8001, затем
+# BYBIT_URL=http://127.0.0.1:8001 BYBIT_WS_URL=ws://127.0.0.1:8001/v5/public/spot uvicorn api:app
+
+BLOCK = 4096
+
+
+@lru_cache(maxsize=512)
+def candle_block(symbol, step, block):
+    # Свечи генерируются блоками по номеру бара, поэтому любой диапазон
+    # воспроизводится одинаково независимо от того, как его запрашивают
+    rng = np.random.default_rng([zlib.crc32(symbol.encode()), step // 60_000, block])
+    idx = block * BLOCK + np.arange(BLOCK, dtype=np.float64)
+    base = 10.0 + zlib.crc32(symbol.encode()) % 50_000
+    trend = 0.15 * np.sin(2 * np.pi * idx / 20011) + 0.05 * np.sin(2 * np.pi * idx / 1009 + 1.0)
+
+    close = base * np.exp(trend + 0.002 * rng.normal(size=BLOCK))
+    open_ = close * np.exp(0.001 * rng.normal(size=BLOCK))
+    high = np.maximum(open_, close) * (1 + 0.001 * np.abs(rng.normal(size=BLOCK)))
+    low = np.minimum(open_, close) * (1 - 0.001 * np.abs(rng.normal(size=BLOCK)))
+    volume = rng.lognormal(0, 0.5, BLOCK) * np.where(rng.random(BLOCK) < 0.02, 5.0, 1.0)
+    return np.column_stack([open_, high, low, close, volume, volume * close])
+
+
+def candle(symbol, step, bar):
+    return candle_block(symbol, step, bar // BLOCK)[bar % BLOCK]
+
+
+def klines(symbol, step, first, last):
+    # Строки в формате Bybit (все поля строками) от новых к старым
+    return [
+        [str(bar * step)] + [f"{v:.4f}" for v in candle(symbol, step, bar)]
+        for bar in range(last // step, first // step - 1, -1)
+    ]
+
+
+def stream_candle(symbol, interval, step, bar, confirm):
+    open_, high, low, close, volume, turnover = (f"{v:.4f}" for v in candle(symbol, step, bar))
+    return {
+        "start": bar * step, "end": (bar + 1) * step - 1, "interval": interval,
+        "open": open_, "high": high, "low": low, "close": close, "volume": volume, "turnover": turnover,
+        "confirm": confirm, "timestamp": int(time.time() * 1000)
+    }
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def create_app(latency=0.05, jitter=0.02, rate_limit=None, rate_limit_mode="10006", error_rate=0.0, seed=0,
+               ws_interval=1.0, ws_drop_after=None, clock_speed=1.0, api_key="mock-key", api_secret="mock-secret", fee_rate=0.001):
+    """latency и jitter в секундах, rate_limit - запросов в секунду (None - без ограничения).
+
+    При превышении лимита отвечает как Bybit: HTTP 200 с retCode 10006
+    или HTTP 429, в зависимости от rate_limit_mode. Поток kline шлёт текущую
+    свечу каждые ws_interval секунд и рвёт соединение через ws_drop_after секунд.
+    clock_speed ускоряет время биржи: при 60 минутная свеча закрывается каждую секунду.
+    Ордера (paper trading) принимаются с подписью ключа api_key/api_secret и
+    сразу исполняются по закрытию текущей минутной свечи. Комиссия fee_rate берётся
+    в получаемой монете, продажа больше купленного отклоняется, как на spot.
+    """
+    app = FastAPI()
+    bucket = TokenBucket(rate_limit) if rate_limit else None
+    rnd = random.Random(seed)
+    signer = Signer(api_key, api_secret)
+    origin = time.time()
+    stats = {"requests": 0, "rate_limited": 0, "errors": 0, "ws_connections": 0, "orders": 0}
+    orders = []
+    # Купленные монеты по символу
+    holdings = {}
+
+    def now_ms():
+        return int((origin + (time.time() - origin) * clock_speed) * 1000)
+
+    def reply(result=None, code=0, message="OK"):
+        return {"retCode": code, "retMsg": message, "result": result or {}, "retExtInfo": {}, "time": now_ms()}
+
+    @app.get(KLINE_PATH)
+    async def get_kline(
+        symbol: str = Query(...),
+        interval: str = Query(...),
+        category: str = Query("linear"),
+        start: int = Query(None),
+        end: int = Query(None),
+        limit: int = Query(200, ge=1, le=1000)
+    ):
+        stats["requests"] += 1
+        await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+
+        if bucket is not None and not bucket.take():
+            stats["rate_limited"] += 1
+            if rate_limit_mode == "429":
+                return PlainTextResponse("Too many visits!", status_code=429)
+            return reply(code=10006, message="Too many visits!")
+
+        if error_rate and rnd.random() < error_rate:
+            stats["errors"] += 1
+            return PlainTextResponse("Bad Gateway", status_code=502)
+
+        step = INTERVAL_MS.get(interval)
+        if step is None:
+            return reply(code=10001, message="Invalid period!")
+
+        # Последняя свеча - текущая, ещё не закрытая, как у Bybit
+        now_bar = now_ms() // step * step
+        last = now_bar if end is None else min(end // step * step, now_bar)
+        if start is not None:
+            # Страница начинается со start: так её листает ExchangeSimulator.fetch_range
+            first = -(-start // step) * step
+            last = min(last, first + (limit - 1) * step)
+        else:
+            first = last - (limit - 1) * step
+
+        rows = klines(symbol, step, first, last) if first <= last else []
+        return reply({"symbol": symbol, "category": category, "list": rows})
+
+    @app.get("/v5/market/time")
+    def get_time():
+        now = now_ms()
+        return reply({"timeSecond": str(now // 1000), "timeNano": str(now * 1_000_000)})
+
+    def check_sign(request, payload):
+        headers = request.headers
+        if headers.get("X-BAPI-API-KEY") != api_key:
+            return reply(code=10003, message="API key is invalid.")
+        timestamp = headers.get("X-BAPI-TIMESTAMP", "")
+        expected = signer.sign(timestamp, payload)
+        if headers.get("X-BAPI-SIGN") != expected:
+            return reply(code=10004, message="error sign!")
+        return None
+
+    @app.post(ORDER_PATH)
+    async def create_order(request: Request):
+        await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+        payload = (await request.body()).decode("utf-8")
+        error = check_sign(request, payload)
+        if error is not None:
+            return error
+
+        body = json.loads(payload)
+        # Рыночный ордер исполняется сразу по закрытию текущей минутной свечи
+        bar = now_ms() // 60_000
+        price = candle(body["symbol"], 60_000, bar)[3]
+        qty = float(body["qty"])
+        held = holdings.get(body["symbol"], 0.0)
+        if body["side"] == "Buy":
+            # Рыночная покупка на spot по умолчанию задаётся суммой в валюте котировки
+            base = qty if body.get("marketUnit") == "baseCoin" else qty / price
+            exec_qty, exec_value, exec_fee = base, base * price, base * fee_rate
+            holdings[body["symbol"]] = held + base - exec_fee
+        else:
+            if qty > held + 1e-12:
+                return reply(code=170131, message="Insufficient balance.")
+            exec_qty, exec_value, exec_fee = qty, qty * price, qty * price * fee_rate
+            holdings[body["symbol"]] = held - qty
+        order = {
+            "orderId": uuid.uuid4().hex, "orderLinkId": body.get("orderLinkId", ""),
+            "category": body.get("category", "spot"), "symbol": body["symbol"], "side": body["side"],
+            "orderType": body.get("orderType", "Market"), "qty": body["qty"], "price": f"{price:.4f}",
+            "avgPrice": f"{price:.4f}", "orderStatus": "Filled", "cumExecQty": f"{exec_qty:.10f}",
+            "cumExecValue": f"{exec_value:.10f}", "cumExecFee": f"{exec_fee:.10f}",
+            "createdTime": str(now_ms()), "updatedTime": str(now_ms())
+        }
+        orders.append(order)
+        stats["orders"] += 1
+        return reply({"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]})
+
+    @app.get(ORDER_HISTORY_PATH)
+    async def get_order_history(request: Request, category: str = Query(...), symbol: str = Query(None), limit: int = Query(20)):
+        await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+        error = check_sign(request, request.url.query)
+        if error is not None:
+            return error
+        history = [o for o in reversed(orders) if o["category"] == category and (symbol is None or o["symbol"] == symbol)]
+        return reply({"category": category, "list": history[:limit], "nextPageCursor": ""})
+
+    @app.get(ORDER_REALTIME_PATH)
+    async def get_order_realtime(request: Request, category: str = Query(...), orderId: str = Query(None)):
+        await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+        error = check_sign(request, request.url.query)
+        if error is not None:
+            return error
+        found = [o for o in orders if o["category"] == category and (orderId is None or o["orderId"] == orderId)]
+        return reply({"category": category, "list": found, "nextPageCursor": ""})
+
+    @app.get(INSTRUMENTS_PATH)
+    def get_instruments(category: str = Query(...), symbol: str = Query(...)):
+        # Точность как у Bybit spot: DOGE торгуется с шагом 0.1
+        base_precision = "0.1" if symbol.startswith("DOGE") else "0.000001"
+        return reply({"category": category, "list": [{
+            "symbol": symbol, "status": "Trading",
+            "lotSizeFilter": {"basePrecision": base_precision, "quotePrecision": "0.00000001", "minOrderQty": base_precision}
+        }]})
+
+    @app.get(WALLET_BALANCE_PATH)
+    async def get_wallet_balance(request: Request, accountType: str = Query(...)):
+        await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+        error = check_sign(request, request.url.query)
+        if error is not None:
+            return error
+        if accountType != "UNIFIED":
+            return reply(code=10001, message="accountType only support UNIFIED.")
+        coins = [{"coin": "USDT", "walletBalance": "10000", "usdValue": "10000", "unrealisedPnl": "0"}]
+        return reply({"list": [{"accountType": accountType, "coin": coins}]})
+
+    @app.websocket("/v5/public/{category}")
+    async def kline_stream(websocket: WebSocket, category: str):
+        await websocket.accept()
+        stats["ws_connections"] += 1
+        topics = {}
+
+        async def push():
+            started = time.monotonic()
+            while ws_drop_after is None or time.monotonic() - started < ws_drop_after:
+                for topic, previous in list(topics.items()):
+                    _, interval, symbol = topic.split(".", 2)
+                    step = INTERVAL_MS[interval]
+                    bar = now_ms() // step
+                    data = [stream_candle(symbol, interval, step, bar, False)]
+                    if previous is not None and previous < bar:
+                        # Закрытие предыдущей свечи приходит с confirm=true
+                        data.insert(0, stream_candle(symbol, interval, step, previous, True))
+                    topics[topic] = bar
+                    await websocket.send_json({"topic": topic, "type": "snapshot", "ts": now_ms(), "data": data})
+                await asyncio.sleep(ws_interval)
+            await websocket.close()
+
+        pusher = asyncio.create_task(push())
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if message.get("op") == "subscribe":
+                    for topic in message.get("args", []):
+                        if topic.startswith("kline.") and topic.split(".")[1] in INTERVAL_MS:
+                            topics.setdefault(topic, None)
+                    await websocket.send_json({"success": True, "ret_msg": "", "op": "subscribe", "conn_id": "mock"})
+                elif message.get("op") == "ping":
+                    await websocket.send_json({"success": True, "ret_msg": "pong", "op": "ping", "conn_id": "mock"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            pusher.cancel()
+
+    @app.get("/mock/stats")
+    def get_stats():
+        return stats
+
+    return app
+
+
+app = create_app(
+    latency=float(os.environ.get("MOCK_LATENCY_MS", "50")) / 1000,
+    jitter=float(os.environ.get("MOCK_JITTER_MS", "20")) / 1000,
+    rate_limit=float(os.environ["MOCK_RATE_LIMIT"]) if os.environ.get("MOCK_RATE_LIMIT") else None,
+    rate_limit_mode=os.environ.get("MOCK_RATE_LIMIT_MODE", "10006"),
+    error_rate=float(os.environ.get("MOCK_ERROR_RATE", "0")),
+    ws_interval=float(os.environ.get("MOCK_WS_INTERVAL_MS", "1000")) / 1000,
+    ws_drop_after=float(os.environ["MOCK_WS_DROP_AFTER"]) if os.environ.get("MOCK_WS_DROP_AFTER") else None,
+    clock_speed=float(os.environ.get("MOCK_CLOCK_SPEED", "1")),
+    api_key=os.environ.get("MOCK_API_KEY", "mock-key"),
+    api_secret=os.environ.get("MOCK_API_SECRET", "mock-secret")
+)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Optional, Union
 
 
 class BacktestResult(BaseModel):
@@ -7,6 +7,33 @@ class BacktestResult(BaseModel):
     equity_curve: List[float]
     trade_history: List[dict]
     final_balance: float
+    profile: Optional[Dict[str, Any]] = None
+
+
+class BacktestJobRequest(BaseModel):
+    ticker: str
+    start_date: str
+    end_date: str
+    timeframe: str = "1h"
+    vectorized: bool = False
+
+
+class BacktestJobStatus(BaseModel):
+    job_id: str
+    status: str
+    processed: int
+    total: Optional[int] = None
+    eta_seconds: Optional[float] = None
+    result: Optional[BacktestResult] = None
+    error: Optional[str] = None
+
+
+class PortfolioResult(BaseModel):
+    timestamps: List[str]
+    equity_curve: List[float]
+    symbol_equity: Dict[str, List[float]]
+    trade_history: List[dict]
+    final_balance: float
 
 
 class PriceData(BaseModel):
@@ -16,3 +43,18 @@ class PriceData(BaseModel):
     ema: List[float]
     rsi: List[float]
     recommendation: str
+
+
+class SweepRequest(BaseModel):
+    ticker: str
+    start_date: str
+    end_date: str
+    timeframe: str = "1h"
+    bot: str = "ModernRSIVolumeBot"
+    grid: Dict[str, List[Union[int, float]]]
+    processes: Union[int, None] = None
+
+
+class SweepResult(BaseModel):
+    combinations: int
+    results: List[dict]
@@ -0,0 +1,147 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+from backtest import ExchangeSimulator, BacktestManager, DEFAULT_STORE, SIDES
+from bots import BOTS
+
+
+def _run_symbol(symbol, timeframe, data, bot, bot_params, vectorized):
+    exchange = ExchangeSimulator(symbol=symbol, timeframe=timeframe, store=None)
+    exchange.data = data
+    BacktestManager(exchange, BOTS[bot](exchange, **bot_params)).run(vectorized=vectorized)
+    return exchange.trades[:exchange.trade_count]
+
+
+class PortfolioBacktest:
+    """Портфельный бэктест: по боту на символ и общий денежный баланс.
+
+    Решения ботов зависят только от наличия позиции по своему символу, поэтому
+    символы прогоняются независимо и параллельно, а затем сделки сводятся по
+    времени против общего кэша: покупка тратит cash / число символов без позиции.
+    """
+
+    def __init__(self, symbols, timeframe="1h", start_balance=10000, bot="ModernRSIVolumeBot",
+                 bot_params=None, store=DEFAULT_STORE):
+        if bot not in BOTS:
+            raise Exception(f"Unknown bot: {bot}")
+        # Повторный символ запустил бы второго бота на той же доле кэша; порядок сохраняется
+        self.symbols = list(dict.fromkeys(symbols))
+        self.timeframe = timeframe
+        self.start_balance = start_balance
+        self.bot = bot
+        self.bot_params = bot_params or {}
+        self.store = store
+        self.fee = 0.001
+        self.data = {}
+        self.timestamps = None
+        self.equity_curve = None
+        self.symbol_equity = {}
+        self.history = []
+        self.balance = start_balance
+        self.units = dict.fromkeys(self.symbols, 0.0)
+
+    def load_data(self, start_date=None, end_date=None):
+        def load(symbol):
+            exchange = ExchangeSimulator(symbol=symbol, timeframe=self.timeframe, store=self.store)
+            exchange.load_data(start_date=start_date, end_date=end_date)
+            return exchange.data
+
+        with ThreadPoolExecutor(max_workers=len(self.symbols)) as pool:
+            self._align(dict(zip(self.symbols, pool.map(load, self.symbols))))
+
+    async def load_data_async(self, client, start_date=None, end_date=None):
+        async def load(symbol):
+            exchange = ExchangeSimulator(symbol=symbol, timeframe=self.timeframe, store=self.store)
+            await exchange.load_data_async(client, start_date=start_date, end_date=end_date)
+            return exchange.data
+
+        frames = await asyncio.gather(*(load(symbol) for symbol in self.symbols))
+        self._align(dict(zip(self.symbols, frames)))
+
+    def _align(self, frames):
+        # Общая временная шкала - пересечение меток всех символов
+        common = None
+        for df in frames.values():
+            common = df["timestamp"] if common is None else common[common.isin(df["timestamp"])]
+        if common is None or len(common) < 2:
+            raise Exception("No common timestamps for requested symbols.")
+
+        self.data = {
+            symbol: df[df["timestamp"].isin(common)].reset_index(drop=True)
+            for symbol, df in frames.items()
+        }
+
+    def run(self, vectorized=True, processes=None):
+        processes = min(processes or os.cpu_count() or 1, len(self.symbols))
+        with ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn")) as pool:
+            futures = {
+                symbol: pool.submit(
+                    _run_symbol, symbol, self.timeframe, self.data[symbol],
+                    self.bot, self.bot_params, vectorized
+                )
+                for symbol in self.symbols
+            }
+            histories = {symbol: future.result() for symbol, future in futures.items()}
+        self.settle(histories)
+
+    def settle(self, histories):
+        timestamps = self.data[self.symbols[0]]["timestamp"]
+        steps = len(timestamps) - 1
+        epoch_ms = timestamps.to_numpy(dtype="datetime64[ms]").view(np.int64)
+
+        # Внутри бара сделки идут в порядке символов и в исходном порядке для каждого символа
+        events = sorted(
+            (idx, order, seq, symbol, SIDES[side], price)
+            for order, symbol in enumerate(self.symbols)
+            for seq, (idx, side, price) in enumerate(zip(
+                np.searchsorted(epoch_ms, histories[symbol]["timestamp"]).tolist(),
+                histories[symbol]["side"].tolist(),
+                histories[symbol]["price"].tolist()
+            ))
+        )
+
+        cash = float(self.start_balance)
+        units = dict.fromkeys(self.symbols, 0.0)
+        # Кусочно-постоянные кэш и позиции: значение действует с бара change_idx включительно
+        change_idx, cash_levels = [0], [cash]
+        unit_levels = {symbol: [0.0] for symbol in self.symbols}
+        self.history = []
+
+        for idx, _, _, symbol, side, price in events:
+            if side == 'BUY':
+                flat = sum(1 for s in self.symbols if units[s] == 0)
+                spend = cash / flat
+                units[symbol] = spend * (1 - self.fee) / price
+                cash -= spend
+                amount = units[symbol]
+            else:
+                amount = units[symbol]
+                cash += amount * price * (1 - self.fee)
+                units[symbol] = 0.0
+            self.history.append((timestamps.iloc[idx], symbol, side, price, amount))
+
+            if change_idx[-1] != idx:
+                change_idx.append(idx)
+                cash_levels.append(cash)
+                for s in self.symbols:
+                    unit_levels[s].append(unit_levels[s][-1])
+            cash_levels[-1] = cash
+            unit_levels[symbol][-1] = units[symbol]
+
+        segment = np.searchsorted(change_idx, np.arange(steps), side="right") - 1
+        cash_curve = np.asarray(cash_levels)[segment]
+        self.symbol_equity = {
+            symbol: np.asarray(unit_levels[symbol])[segment] * self.data[symbol]["close"].to_numpy(dtype=float)[:steps]
+            for symbol in self.symbols
+        }
+        self.equity_curve = cash_curve + sum(self.symbol_equity.values())
+        self.timestamps = timestamps.iloc[:steps]
+        self.balance = cash
+        self.units = units
+
+    def get_equity(self):
+        return self.balance + sum(
+            self.units[symbol] * self.data[symbol]["close"].iloc[-1] for symbol in self.symbols
+        )
@@ -0,0 +1,114 @@
+import asyncio
+import time
+import pandas as pd
+from bs import add_indicators
+from bybit import INTERACTIVE, INTERVAL_MS
+from ingest import BACKFILL_LIMIT, CandleRing
+
+
+# Сколько ждать после закрытия свечи, чтобы Bybit успел её отдать, в секундах
+CLOSE_DELAY = 1.0
+
+
+class PrewarmScheduler:
+    """Держит в памяти последние свечи и индикаторы /history для популярных пар.
+
+    После первой загрузки пара обновляется по закрытию своей свечи и каждые refresh
+    секунд (текущая свеча), запрашиваются только свечи начиная с последней известной.
+    SMA/EMA/RSI пересчитываются сразу после обновления, запросы /history их только отдают.
+    Обновления идут с приоритетом INTERACTIVE: они обслуживают графики, а не бэктесты.
+    Пары из skip (например, уже покрытые потоком kline) не прогреваются.
+    """
+
+    def __init__(self, client, tickers, intervals, capacity=1000, refresh=60.0, category="spot", skip=()):
+        self.client = client
+        self.category = category
+        self.refresh_ms = int(refresh * 1000)
+        self.rings = {
+            (symbol, interval): CandleRing(capacity, INTERVAL_MS[interval])
+            for symbol in tickers for interval in intervals if (symbol, interval) not in skip
+        }
+        # (версия буфера, DataFrame с Date, Close, SMA, EMA, RSI)
+        self.frames = {}
+        self.task = None
+        self.stats = {"refreshes": 0, "errors": 0, "last_refresh": None}
+
+    def get(self, symbol, interval, limit):
+        # (версия, DataFrame) или None, если пара не прогрета, в ней меньше limit свечей
+        # или последняя свеча закончилась больше интервала назад (обновление отстало)
+        entry = self.frames.get((symbol, interval))
+        if entry is None or len(entry[1]) < limit:
+            return None
+        ring = self.rings[(symbol, interval)]
+        if time.time() * 1000 - ring.last_timestamp > 2 * ring.step:
+            return None
+        return entry
+
+    async def start(self):
+        if self.rings:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def next_due(self, interval, now_ms):
+        # Ближайшее закрытие свечи или плановое обновление текущей, epoch ms
+        step = INTERVAL_MS[interval]
+        due = (now_ms // step + 1) * step
+        if self.refresh_ms:
+            due = min(due, (now_ms // self.refresh_ms + 1) * self.refresh_ms)
+        return due
+
+    async def _run(self):
+        await self._refresh_all(list(self.rings))
+        while True:
+            now_ms = int(time.time() * 1000)
+            wake = min(self.next_due(interval, now_ms) for _, interval in self.rings)
+            await asyncio.sleep((wake - now_ms) / 1000 + CLOSE_DELAY)
+            await self._refresh_all([key for key in self.rings if self.next_due(key[1], now_ms) <= wake])
+
+    async def _refresh_all(self, keys):
+        results = await asyncio.gather(*(self._refresh(*key) for key in keys), return_exceptions=True)
+        for (symbol, interval), result in zip(keys, results):
+            if isinstance(result, Exception):
+                self.stats["errors"] += 1
+                print(f"Prewarm error {symbol} {interval}: {result}")
+        self.stats["last_refresh"] = int(time.time() * 1000)
+
+    async def _refresh(self, symbol, interval):
+        ring = self.rings[(symbol, interval)]
+        last = ring.last_timestamp
+        limit = min(ring.capacity, BACKFILL_LIMIT)
+        if last is None or time.time() * 1000 - last > limit * ring.step:
+            result = await self.client.get_kline(symbol, interval, category=self.category, limit=limit, priority=INTERACTIVE)
+        else:
+            # С последней известной свечи: она могла быть незакрытой и обновилась
+            result = await self.client.get_kline(
+                symbol, interval, category=self.category, limit=limit, start=last, priority=INTERACTIVE
+            )
+        if result.get("retCode") != 0:
+            raise Exception(f"Bybit API error: {result.get('retCode')} {result.get('retMsg')}")
+        rows = result["result"]["list"]
+        if not rows:
+            return
+        # Последняя известная свеча могла быть незакрытой: REST-версия её заменяет
+        ring.extend(rows, prefer_new=True)
+
+        order = ring.ordered()
+        df = pd.DataFrame({
+            "Date": pd.to_datetime(ring.timestamp[order], unit="ms"),
+            "Close": ring.values[order, 3]
+        })
+        self.frames[(symbol, interval)] = (ring.version, add_indicators(df))
+        self.stats["refreshes"] += 1
+
+    def status(self):
+        return {
+            **self.stats,
+            "pairs": {
+                f"{symbol}:{interval}": {"count": ring.count, "last": ring.last_timestamp, "version": ring.version}
+                for (symbol, interval), ring in self.rings.items()
+            }
+        }
@@ -0,0 +1,213 @@
+import argparse
+import inspect
+import os
+import pstats
+import sys
+import numpy as np
+
+
+# Методы ботов, которые считают индикаторы, а не принимают решения
+INDICATOR_METHODS = {"compute_rsi", "signals", "reset_indicators", "update_indicators"}
+
+_qualnames = {}
+
+
+def qualname(key):
+    # В pstats функция - (файл, строка, имя); имя класса восстанавливается по исходному модулю
+    filename, lineno, name = key
+    if filename not in _qualnames:
+        names = {}
+        module = next((m for m in list(sys.modules.values()) if getattr(m, "__file__", None) == filename), None)
+        if module is not None:
+            for _, obj in inspect.getmembers(module):
+                members = [m for _, m in inspect.getmembers(obj)] if inspect.isclass(obj) else [obj]
+                for member in members:
+                    # У свойств код лежит в fget/fset
+                    for func in (member.fget, member.fset) if isinstance(member, property) else (member,):
+                        code = getattr(inspect.unwrap(func), "__code__", None) if callable(func) else None
+                        if code is not None and code.co_filename == filename:
+                            names[code.co_firstlineno, code.co_name] = code.co_qualname
+        _qualnames[filename] = names
+    return _qualnames[filename].get((lineno, name), name)
+
+
+def label(key):
+    filename, _, name = key
+    if filename == "~":
+        return name.replace(";", ",")
+    return f"{os.path.basename(filename)}:{qualname(key)}"
+
+
+def category(key):
+    filename, _, name = key
+    base = os.path.basename(filename)
+    if base == "bs.py":
+        return "indicators"
+    if base == "bots.py":
+        return "indicators" if name in INDICATOR_METHODS else "bot"
+    if base == "backtest.py" and qualname(key).startswith("ExchangeSimulator."):
+        return "simulator"
+    return None
+
+
+class RunProfile:
+    """Результат BacktestManager.profile: задержки тиков и статистика cProfile."""
+
+    def __init__(self, tick_ns, wall_seconds, profiler=None):
+        self.tick_ns = tick_ns
+        self.wall_seconds = wall_seconds
+        self.stats = pstats.Stats(profiler).stats if profiler is not None else {}
+
+    def ticks(self):
+        if not len(self.tick_ns):
+            return {"count": 0}
+        p50, p90, p99 = np.percentile(self.tick_ns, [50, 90, 99]) / 1000
+        return {
+            "count": int(len(self.tick_ns)),
+            "mean_us": float(self.tick_ns.mean() / 1000),
+            "p50_us": float(p50),
+            "p90_us": float(p90),
+            "p99_us": float(p99),
+            "max_us": float(self.tick_ns.max() / 1000)
+        }
+
+    def categories(self):
+        # Время категории - вызовы в неё из других категорий за вычетом вызовов из неё
+        # в другие категории: тик бота не включает время индикаторов и симулятора
+        totals = {}
+        for key, (_, _, _, cumulative, callers) in self.stats.items():
+            name = category(key)
+            if name is not None:
+                outside = [edge[3] for caller, edge in callers.items() if category(caller) != name]
+                totals[name] = totals.get(name, 0.0) + (sum(outside) if callers else cumulative)
+            for caller, edge in callers.items():
+                caller_name = category(caller)
+                if caller_name is not None and caller_name != name:
+                    totals[caller_name] = totals.get(caller_name, 0.0) - edge[3]
+        return {name: {"seconds": seconds, "share": seconds / self.wall_seconds if self.wall_seconds else 0.0}
+                for name, seconds in sorted(totals.items(), key=lambda item: -item[1])}
+
+    def simulator_calls(self):
+        return {qualname(key).split(".", 1)[1]: calls
+                for key, (_, calls, _, _, _) in self.stats.items() if category(key) == "simulator"}
+
+    def functions(self, top=20):
+        rows = [
+            {"function": label(key), "calls": calls, "self_ms": own * 1000, "cumulative_ms": cumulative * 1000,
+             "per_call_us": cumulative / calls * 1e6 if calls else 0.0}
+            for key, (_, calls, own, cumulative, _) in self.stats.items() if category(key) is not None
+        ]
+        return sorted(rows, key=lambda row: -row["cumulative_ms"])[:top]
+
+    def summary(self, top=20):
+        return {
+            "wall_seconds": self.wall_seconds,
+            "ticks": self.ticks(),
+            "categories": self.categories(),
+            "simulator_calls": self.simulator_calls(),
+            "functions": self.functions(top)
+        }
+
+    def table(self, top=20):
+        lines = [f"wall: {self.wall_seconds * 1000:.1f} ms"]
+        ticks = self.ticks()
+        if ticks["count"]:
+            lines.append(
+                f"ticks: {ticks['count']}, mean {ticks['mean_us']:.2f} us, p50 {ticks['p50_us']:.2f}, "
+                f"p90 {ticks['p90_us']:.2f}, p99 {ticks['p99_us']:.2f}, max {ticks['max_us']:.2f}"
+            )
+        if self.stats:
+            lines.append("")
+            lines.append(f"{'category':<14}{'ms':>12}{'share':>8}")
+            for name, row in self.categories().items():
+                lines.append(f"{name:<14}{row['seconds'] * 1000:>12.1f}{row['share']:>8.1%}")
+            lines.append("")
+            lines.append(f"{'simulator call':<24}{'count':>10}")
+            for name, calls in sorted(self.simulator_calls().items()):
+                lines.append(f"{name:<24}{calls:>10}")
+            lines.append("")
+            lines.append(f"{'function':<48}{'calls':>10}{'self ms':>10}{'cum ms':>10}{'us/call':>10}")
+            for row in self.functions(top):
+                lines.append(
+                    f"{row['function']:<48}{row['calls']:>10}{row['self_ms']:>10.1f}"
+                    f"{row['cumulative_ms']:>10.1f}{row['per_call_us']:>10.2f}"
+                )
+        return "\n".join(lines)
+
+    def collapsed(self, min_us=1):
+        # Свёрнутые стеки для flamegraph.pl / speedscope. cProfile хранит только пары
+        # вызывающий-вызываемый, поэтому время по путям распределяется пропорционально рёбрам
+        children = {}
+        for key, (_, _, _, _, callers) in self.stats.items():
+            for caller in callers:
+                children.setdefault(caller, []).append(key)
+
+        weights = {}
+
+        def walk(key, stack, fraction):
+            _, _, own, cumulative, _ = self.stats[key]
+            stack = stack + (key,)
+            weights[stack] = weights.get(stack, 0.0) + own * fraction
+            for child in children.get(key, []):
+                if child in stack:
+                    continue
+                child_cumulative = self.stats[child][3]
+                edge = self.stats[child][4][key][3]
+                if child_cumulative > 0 and edge * fraction * 1e6 >= min_us:
+                    walk(child, stack, edge * fraction / child_cumulative)
+
+        for key, (_, _, _, _, callers) in self.stats.items():
+            if not callers:
+                walk(key, (), 1.0)
+
+        return [
+            f"{';'.join(label(key) for key in stack)} {int(seconds * 1e6)}"
+            for stack, seconds in weights.items() if seconds * 1e6 >= min_us
+        ]
+
+    def dump(self, prof_path=None, collapsed_path=None):
+        if prof_path:
+            stats = pstats.Stats()
+            stats.stats = self.stats
+            stats.dump_stats(prof_path)
+        if collapsed_path:
+            with open(collapsed_path, "w") as file:
+                file.write("\n".join(self.collapsed()) + "\n")
+
+
+def main(argv=None):
+    from backtest import ExchangeSimulator, BacktestManager
+    from bots import BOTS
+
+    parser = argparse.ArgumentParser(description="Профилирование бэктеста: задержки тиков, вызовы симулятора, время индикаторов")
+    parser.add_argument("--bot", default="ModernRSIVolumeBot", choices=list(BOTS))
+    parser.add_argument("--ticker", default="BTCUSDT")
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--start-date", default=None)
+    parser.add_argument("--end-date", default=None)
+    parser.add_argument("--synthetic", type=int, default=0, help="вместо Bybit взять N синтетических свечей")
+    parser.add_argument("--vectorized", action="store_true")
+    parser.add_argument("--no-cprofile", action="store_true", help="только задержки тиков, без накладных расходов cProfile")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--prof", default=None, help="сохранить статистику cProfile (.prof)")
+    parser.add_argument("--collapsed", default=None, help="сохранить свёрнутые стеки для flamegraph")
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        from synthetic import synthetic_ohlcv
+        exchange = ExchangeSimulator(symbol=args.ticker, timeframe=args.timeframe, store=None)
+        exchange.data = synthetic_ohlcv(args.synthetic, timeframe=args.timeframe)
+    else:
+        if not args.start_date or not args.end_date:
+            parser.error("нужны --start-date и --end-date или --synthetic")
+        exchange = ExchangeSimulator(symbol=args.ticker, timeframe=args.timeframe)
+        exchange.load_data(start_date=args.start_date, end_date=args.end_date)
+
+    manager = BacktestManager(exchange, BOTS[args.bot](exchange))
+    profile = manager.profile(vectorized=args.vectorized, cprofile=not args.no_cprofile)
+    print(profile.table(args.top))
+    profile.dump(args.prof, args.collapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+TIMEFRAME_MS = {
+    "1m": 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "1d": 24 * 60 * 60_000
+}
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+# Части с данными, которые сливаются в одну при превышении этого числа
+MAX_PARTS = 16
+
+# Таймфрейм, из которого выводятся все остальные; пустое значение - каждый таймфрейм качается отдельно
+BASE_TIMEFRAME = os.getenv("CANDLE_BASE_TIMEFRAME", "1m")
+
+
+class CandleStore:
+    """Локальное хранилище свечей: Parquet-части по символу и таймфрейму.
+
+    Имя каждой части `<start>_<end>.parquet` хранит запрошенный диапазон
+    (epoch ms), поэтому покрытие известно без чтения файлов, а пропуски
+    биржи внутри диапазона повторно не скачиваются.
+
+    С биржи качается только базовый таймфрейм (base), старшие собираются из него
+    resample и сохраняются как отдельный таймфрейм, так что повторно не пересчитываются.
+    """
+
+    def __init__(self, root=None, base=BASE_TIMEFRAME):
+        self.root = root or os.getenv("CANDLE_STORE_DIR", os.path.join("data", "candles"))
+        self.base = base or None
+        # Запись и слияние частей одного символа и таймфрейма не идут параллельно
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+    def _lock(self, symbol, timeframe):
+        with self.locks_guard:
+            return self.locks.setdefault((symbol, timeframe), threading.Lock())
+
+    def derived(self, timeframe):
+        return self.base is not None and timeframe != self.base
+
+    def base_range(self, timeframe, start_ts, end_ts):
+        # Диапазон базовых свечей, покрывающий последнюю свечу timeframe целиком
+        step = TIMEFRAME_MS[timeframe]
+        return start_ts, end_ts // step * step + step - 1
+
+    def _dir(self, symbol, timeframe):
+        return os.path.join(self.root, symbol, timeframe)
+
+    def _parts(self, symbol, timeframe):
+        directory = self._dir(symbol, timeframe)
+        if not os.path.isdir(directory):
+            return []
+        parts = []
+        for name in os.listdir(directory):
+            if not name.endswith(".parquet"):
+                continue
+            start, end = name[:-len(".parquet")].split("_")
+            parts.append((int(start), int(end), os.path.join(directory, name)))
+        return sorted(parts)
+
+    def coverage(self, symbol, timeframe):
+        merged = []
+        for start, end, _ in self._parts(symbol, timeframe):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [tuple(r) for r in merged]
+
+    def missing_ranges(self, symbol, timeframe, start_ts, end_ts):
+        missing = []
+        cursor = start_ts
+        for start, end in self.coverage(symbol, timeframe):
+            if end < cursor:
+                continue
+            if start > end_ts:
+                break
+            if start > cursor:
+                missing.append((cursor, start - 1))
+            cursor = max(cursor, end + 1)
+        if cursor <= end_ts:
+            missing.append((cursor, end_ts))
+        return missing
+
+    def closed_until(self, timeframe, now_ms=None):
+        # Последняя миллисекунда перед открытием текущей (незакрытой) свечи
+        step = TIMEFRAME_MS[timeframe]
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return now_ms // step * step - 1
+
+    def append(self, symbol, timeframe, df, start_ts, end_ts):
+        end_ts = min(end_ts, self.closed_until(timeframe))
+        if end_ts < start_ts:
+            return
+        part = _to_storage(df)
+        part = part[(part["timestamp"] >= start_ts) & (part["timestamp"] <= end_ts)]
+        self._write(symbol, timeframe, part, start_ts, end_ts)
+        if len(self._parts(symbol, timeframe)) > MAX_PARTS:
+            self.compact(symbol, timeframe)
+
+    def _write(self, symbol, timeframe, part, start_ts, end_ts):
+        directory = self._dir(symbol, timeframe)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{start_ts}_{end_ts}.parquet")
+        tmp_path = path + ".tmp"
+        part.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def compact(self, symbol, timeframe):
+        parts = self._parts(symbol, timeframe)
+        for start, end in self.coverage(symbol, timeframe):
+            group = [p for p in parts if start <= p[0] and p[1] <= end]
+            if len(group) < 2:
+                continue
+            frames = [pd.read_parquet(path) for _, _, path in group]
+            merged = _dedupe(pd.concat(frames))
+            self._write(symbol, timeframe, merged, start, end)
+            for _, _, path in group:
+                if not path.endswith(f"{start}_{end}.parquet"):
+                    os.remove(path)
+
+    def read(self, symbol, timeframe, start_ts, end_ts):
+        frames = []
+        for start, end, path in self._parts(symbol, timeframe):
+            if end < start_ts or start > end_ts:
+                continue
+            frames.append(pd.read_parquet(path, filters=[
+                ("timestamp", ">=", start_ts), ("timestamp", "<=", end_ts)
+            ]))
+        if not frames:
+            return pd.DataFrame(columns=COLUMNS)
+        df = _dedupe(pd.concat(frames))
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+        return df
+
+    def load(self, symbol, timeframe, start_ts, end_ts, fetch):
+        # fetch(range_start, range_end, timeframe) качает свечи с биржи
+        def source(range_start, range_end):
+            if not self.derived(timeframe):
+                return fetch(range_start, range_end, timeframe)
+            base_start, base_end = self.base_range(timeframe, range_start, range_end)
+            return resample(self.load(symbol, self.base, base_start, base_end, fetch), timeframe)
+
+        fetched = [
+            (range_start, range_end, source(range_start, range_end))
+            for range_start, range_end in self.missing_ranges(symbol, timeframe, start_ts, end_ts)
+        ]
+        return self._merge(symbol, timeframe, start_ts, end_ts, fetched)
+
+    async def load_async(self, symbol, timeframe, start_ts, end_ts, fetch):
+        async def source(range_start, range_end):
+            if not self.derived(timeframe):
+                return await fetch(range_start, range_end, timeframe)
+            base_start, base_end = self.base_range(timeframe, range_start, range_end)
+            base = await self.load_async(symbol, self.base, base_start, base_end, fetch)
+            return await asyncio.to_thread(resample, base, timeframe)
+
+        fetched = [
+            (range_start, range_end, await source(range_start, range_end))
+            for range_start, range_end in self.missing_ranges(symbol, timeframe, start_ts, end_ts)
+        ]
+        # Parquet-запись, слияние и чтение - в потоке, чтобы не блокировать event loop
+        return await asyncio.to_thread(self._merge, symbol, timeframe, start_ts, end_ts, fetched)
+
+    def _merge(self, symbol, timeframe, start_ts, end_ts, fetched):
+        with self._lock(symbol, timeframe):
+            return self._merge_locked(symbol, timeframe, start_ts, end_ts, fetched)
+
+    def _merge_locked(self, symbol, timeframe, start_ts, end_ts, fetched):
+        closed_until = self.closed_until(timeframe)
+        forming = []
+        for range_start, range_end, df in fetched:
+            self.append(symbol, timeframe, df, range_start, range_end)
+            # Незакрытая свеча отдаётся вызывающему, но не сохраняется
+            forming.append(_to_storage(df).query("timestamp > @closed_until"))
+        df = self.read(symbol, timeframe, start_ts, end_ts)
+        forming = [f for f in forming if not f.empty]
+        if forming:
+            tail = _dedupe(pd.concat(forming))
+            tail["timestamp"] = pd.to_datetime(tail["timestamp"], unit="ms")
+            df = _dedupe(pd.concat([df, tail]))
+        return df
+
+
+def resample(df, timeframe):
+    # OHLCV старшего таймфрейма из младших свечей; df отсортирован по времени.
+    # Свечи, у которых есть не все младшие (начало диапазона, незакрытая), отсекает append
+    df = _to_storage(df)
+    step = TIMEFRAME_MS[timeframe]
+    timestamp = df["timestamp"].to_numpy(dtype=np.int64)
+    if not len(timestamp):
+        return pd.DataFrame(columns=COLUMNS)
+
+    bucket = timestamp // step * step
+    starts = np.flatnonzero(np.concatenate(([True], bucket[1:] != bucket[:-1])))
+    ends = np.concatenate((starts[1:], [len(bucket)])) - 1
+    return pd.DataFrame({
+        "timestamp": bucket[starts],
+        "open": df["open"].to_numpy(dtype=np.float64)[starts],
+        "high": np.maximum.reduceat(df["high"].to_numpy(dtype=np.float64), starts),
+        "low": np.minimum.reduceat(df["low"].to_numpy(dtype=np.float64), starts),
+        "close": df["close"].to_numpy(dtype=np.float64)[ends],
+        "volume": np.add.reduceat(df["volume"].to_numpy(dtype=np.float64), starts)
+    })
+
+
+def _to_storage(df):
+    df = df[COLUMNS].copy()
+    if pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        df["timestamp"] = df["timestamp"].astype("datetime64[ms]").astype("int64")
+    df["timestamp"] = df["timestamp"].astype("int64")
+    return df
+
+
+def _dedupe(df):
+    return df.drop_duplicates("timestamp", keep="last").sort_values("timestamp").reset_index(drop=True)
@@ -0,0 +1,80 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+import numpy as np
+import pandas as pd
+from backtest import ExchangeSimulator, BacktestManager
+from bots import BOTS
+
+
+PRICE_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# Состояние процесса-воркера: данные подключаются один раз в initializer
+_shm = None
+_data = None
+_settings = None
+
+
+def parameter_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _share(data):
+    # Строка 0 - timestamp в epoch ms (int64), строки 1..5 - OHLCV (float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1) * 6 * 8)
+    block = np.ndarray((6, len(data)), dtype=np.float64, buffer=shm.buf)
+    block[0].view(np.int64)[:] = data["timestamp"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    for row, column in enumerate(PRICE_COLUMNS, start=1):
+        block[row] = data[column].to_numpy(dtype=np.float64)
+    return shm
+
+
+def _attach(name, length, settings):
+    global _shm, _data, _settings
+    _shm = shared_memory.SharedMemory(name=name)
+    block = np.ndarray((6, length), dtype=np.float64, buffer=_shm.buf)
+    columns = {"timestamp": pd.to_datetime(block[0].view(np.int64), unit="ms")}
+    columns.update({column: block[row] for row, column in enumerate(PRICE_COLUMNS, start=1)})
+    _data = pd.DataFrame(columns, copy=False)
+    _settings = settings
+
+
+def _run_one(params):
+    exchange = ExchangeSimulator(
+        symbol=_settings["symbol"], timeframe=_settings["timeframe"],
+        start_balance=_settings["start_balance"], store=None
+    )
+    exchange.data = _data
+    bot = BOTS[_settings["bot"]](exchange, **params)
+    BacktestManager(exchange, bot).run(vectorized=True)
+    return {**params, "final_balance": float(exchange.get_equity()), "trades": exchange.trade_count}
+
+
+def run_sweep(data, bot, grid, symbol="BTCUSDT", timeframe="1h", start_balance=10000, processes=None):
+    if bot not in BOTS:
+        raise Exception(f"Unknown bot: {bot}")
+
+    combinations = parameter_grid(grid)
+    if not combinations:
+        return []
+
+    processes = min(processes or os.cpu_count() or 1, len(combinations))
+    settings = {"bot": bot, "symbol": symbol, "timeframe": timeframe, "start_balance": start_balance}
+    chunksize = max(1, len(combinations) // (processes * 4))
+
+    shm = _share(data)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_attach,
+            initargs=(shm.name, len(data), settings)
+        ) as pool:
+            results = list(pool.map(_run_one, combinations, chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return sorted(results, key=lambda r: r["final_balance"], reverse=True)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from storage import TIMEFRAME_MS
+
+
+def synthetic_ohlcv(n, seed=0, start="2024-01-01", timeframe="1m", price=100.0):
+    """Детерминированные свечи для бенчмарков и локального стенда Bybit.
+
+    Цена - геометрическое блуждание с чередованием режимов волатильности,
+    объём - логнормальный с редкими всплесками.
+    """
+    rng = np.random.default_rng(seed)
+    step = TIMEFRAME_MS[timeframe]
+    start_ms = int(pd.Timestamp(start).timestamp() * 1000) // step * step
+
+    regime = np.repeat(rng.choice([0.0005, 0.001, 0.003], size=n // 500 + 1), 500)[:n]
+    returns = rng.normal(0, 1, n) * regime
+    close = price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate(([price], close[:-1]))
+    spread = np.abs(rng.normal(0, 1, n)) * regime * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    volume = rng.lognormal(0, 0.5, n) * np.where(rng.random(n) < 0.02, 5.0, 1.0)
+
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(start_ms + np.arange(n, dtype=np.int64) * step, unit="ms"),
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "volume": volume
+    })
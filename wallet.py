@@ -0,0 +1,179 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+import numpy as np
+import pandas as pd
+import requests
+
+
+ETHERSCAN_URL = "https://api.etherscan.io/api"
+# Etherscan отдаёт не больше 10000 транзакций на запрос
+PAGE_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    address TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    from_address TEXT NOT NULL,
+    to_address TEXT NOT NULL,
+    value_eth REAL NOT NULL,
+    direction TEXT NOT NULL,
+    equity REAL NOT NULL,
+    PRIMARY KEY (address, hash)
+);
+CREATE INDEX IF NOT EXISTS transactions_seq ON transactions (address, seq);
+CREATE INDEX IF NOT EXISTS transactions_time ON transactions (address, time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    address TEXT PRIMARY KEY,
+    last_block INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    equity REAL NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def with_direction(df, address, equity=0.0, seq=0):
+    # Направление и накопленный баланс для новой порции транзакций, продолжая сохранённые значения
+    outgoing = df["from"].str.lower().to_numpy() == address
+    value_eth = df["value"].astype(float).to_numpy() / 1e18
+    signed = np.where(outgoing, -value_eth, value_eth)
+    return pd.DataFrame({
+        "address": address,
+        "hash": df["hash"].to_numpy(),
+        "block": df["blockNumber"].astype(np.int64).to_numpy(),
+        "seq": seq + np.arange(len(df), dtype=np.int64),
+        "time": df["timeStamp"].astype(np.int64).to_numpy(),
+        "from_address": df["from"].to_numpy(),
+        "to_address": df["to"].to_numpy(),
+        "value_eth": value_eth,
+        "direction": np.where(outgoing, "OUT", "IN"),
+        "equity": equity + np.cumsum(signed)
+    })
+
+
+class WalletStore:
+    """Локальная копия истории транзакций кошелька в SQLite.
+
+    sync докачивает только блоки после последнего синхронизированного, баланс
+    (equity) хранится по каждой транзакции и продолжается от сохранённого значения.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("WALLET_DB", os.path.join("data", "wallet.sqlite"))
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(self.connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def state(self, conn, address):
+        row = conn.execute(
+            "SELECT last_block, count, equity, synced_at FROM sync_state WHERE address = ?", (address,)
+        ).fetchone()
+        return row or (-1, 0, 0.0, 0.0)
+
+    def fetch_page(self, address, api_key, start_block):
+        params = {
+            "module": "account", "action": "txlist", "address": address,
+            "startblock": start_block, "endblock": 99999999,
+            "page": 1, "offset": PAGE_SIZE, "sort": "asc", "apikey": api_key
+        }
+        r = requests.get(ETHERSCAN_URL, params=params, timeout=30).json()
+        if r["status"] != "1":
+            # "No transactions found" - тоже status 0, но это не ошибка
+            if r.get("message", "").startswith("No transactions"):
+                return []
+            raise Exception(f"Etherscan API error: {r.get('message')} {r.get('result')}")
+        return r["result"]
+
+    def sync(self, address, api_key, min_interval=60):
+        # Возвращает число новых транзакций; не чаще раза в min_interval секунд на адрес
+        address = address.lower()
+        added = 0
+        with closing(self.connect()) as conn:
+            last_block, count, equity, synced_at = self.state(conn, address)
+            if time.time() - synced_at < min_interval:
+                return 0
+
+            while True:
+                rows = self.fetch_page(address, api_key, last_block + 1)
+                if not rows:
+                    break
+                df = pd.DataFrame(rows)
+                full = len(rows) == PAGE_SIZE
+                if full:
+                    # Страница могла оборваться посреди блока: последний блок дочитается следующим запросом
+                    blocks = df["blockNumber"].astype(np.int64)
+                    if (blocks != blocks.iloc[-1]).any():
+                        df = df[blocks != blocks.iloc[-1]]
+
+                batch = with_direction(df, address, equity, count)
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch.itertuples(index=False, name=None)
+                    )
+                    last_block, count, equity = int(batch["block"].iloc[-1]), count + len(batch), float(batch["equity"].iloc[-1])
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)",
+                        (address, last_block, count, equity, synced_at)
+                    )
+                added += len(batch)
+                if not full:
+                    break
+
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)",
+                    (address, last_block, count, equity, time.time())
+                )
+        return added
+
+    def summary(self, address, days=7):
+        address = address.lower()
+        since = int(time.time()) - days * 86400
+        with closing(self.connect()) as conn:
+            _, count, equity, _ = self.state(conn, address)
+            delta = conn.execute(
+                "SELECT COALESCE(SUM(CASE direction WHEN 'IN' THEN value_eth ELSE -value_eth END), 0) "
+                "FROM transactions WHERE address = ? AND time > ?",
+                (address, since)
+            ).fetchone()[0]
+        return {"balance": equity, "delta": delta, "count": count}
+
+    def equity(self, address, max_points=None):
+        # С max_points читаются только равномерно расставленные по seq точки (поиск по индексу
+        # transactions_seq), а не вся история: время не зависит от числа транзакций
+        address = address.lower()
+        with closing(self.connect()) as conn:
+            _, count, _, _ = self.state(conn, address)
+            if max_points is None or count <= max_points:
+                df = pd.read_sql_query(
+                    "SELECT time, equity FROM transactions WHERE address = ? ORDER BY seq", conn, params=(address,)
+                )
+            else:
+                seqs = np.unique(np.linspace(0, count - 1, max_points).round().astype(np.int64))
+                df = pd.read_sql_query(
+                    "SELECT time, equity FROM transactions "
+                    "WHERE address = ? AND seq IN (SELECT value FROM json_each(?)) ORDER BY seq",
+                    conn, params=(address, json.dumps(seqs.tolist()))
+                )
+        return pd.Series(df["equity"].to_numpy(), index=pd.to_datetime(df["time"], unit="s"), name="equity")
+
+    def latest(self, address, limit=10):
+        with closing(self.connect()) as conn:
+            df = pd.read_sql_query(
+                "SELECT time, from_address, to_address, value_eth, direction FROM transactions "
+                "WHERE address = ? ORDER BY seq DESC LIMIT ?",
+                conn, params=(address.lower(), limit)
+            )
+        df["time"] = pd.to_datetime(df["time"], unit="s")
+        return df.rename(columns={"time": "timeStamp", "from_address": "from", "to_address": "to"})